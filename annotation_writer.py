@@ -0,0 +1,138 @@
+import os
+import time
+import queue
+import threading
+import cv2
+
+# Annotation output defaults
+OUTPUT_DIR = "annotations"
+SCALE = 0.5            # Frames are downscaled by this factor before encoding
+JPEG_QUALITY = 75
+SAMPLE_EVERY = 1       # Keep every N-th submitted frame
+SEGMENT_SECONDS = 300  # Start a new video file after this long
+KEEP_FILES = 12        # Video segments (or snapshots) kept on disk, older ones are deleted
+MAX_PENDING = 8        # Frames waiting for the encoder; further frames are dropped instead of waiting
+
+# Video containers by format: (file extension, fourcc)
+VIDEO_FORMATS = {
+    "mjpeg": (".avi", "MJPG"),
+    "mp4": (".mp4", "mp4v")
+}
+
+class AnnotationWriter:
+    """
+    Writes annotated frames from a background thread, so drawing and encoding stay off the inference path.
+    submit() never blocks: when the encoder falls behind, frames are dropped and counted.
+    Output is either rolling video segments (MJPEG or MP4) or sampled JPEG snapshots.
+    """
+
+    def __init__(self, draw, output_dir=OUTPUT_DIR, output_format="mjpeg", scale=SCALE, quality=JPEG_QUALITY,
+                 sample_every=SAMPLE_EVERY, fps=10.0, segment_seconds=SEGMENT_SECONDS, keep=KEEP_FILES,
+                 max_pending=MAX_PENDING):
+        """
+        :param draw: Function (image, annotations) -> annotated image, run on the encoder thread.
+        :param output_format: "mjpeg", "mp4" or "jpeg" (snapshots).
+        :param fps: Frame rate written into the video files (the source rate divided by sample_every).
+        :param keep: Number of files kept, 0 keeps everything.
+        """
+        if output_format not in VIDEO_FORMATS and output_format != "jpeg":
+            raise ValueError(f"Unknown annotation format: {output_format}")
+        self.draw = draw
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.scale = scale
+        self.quality = quality
+        self.sample_every = max(1, sample_every)
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.keep = keep
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self._files = []
+        self._segments = 0
+        self._video = None
+        self._segment_started = 0
+        self._queue = queue.Queue(max_pending)
+        os.makedirs(output_dir, exist_ok=True)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, frame, annotations):
+        """
+        Queue a frame and its annotations for writing. The frame must not be modified afterwards
+        (frames from VideoCapture.read() are new arrays every time).
+        :return: True if the frame was queued, False if it was skipped by sampling or dropped.
+        """
+        self.submitted += 1
+        if (self.submitted - 1) % self.sample_every:
+            return False
+        try:
+            self._queue.put_nowait((frame, annotations))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"Error writing annotated frame: {e}")
+        self._close_video()
+
+    def _write(self, frame, annotations):
+        image = self.draw(frame, annotations)
+        if self.scale != 1.0:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        if self.output_format == "jpeg":
+            path = os.path.join(self.output_dir, f"frame-{time.strftime('%Y%m%d-%H%M%S')}-{self.written:06d}.jpg")
+            cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            self._add_file(path)
+        else:
+            if self._video is None or time.monotonic() - self._segment_started >= self.segment_seconds:
+                self._open_video(image.shape[1], image.shape[0])
+            self._video.write(image)
+        self.written += 1
+
+    def _open_video(self, width, height):
+        self._close_video()
+        extension, fourcc = VIDEO_FORMATS[self.output_format]
+        path = os.path.join(self.output_dir, f"annotations-{time.strftime('%Y%m%d-%H%M%S')}-{self._segments:04d}{extension}")
+        self._segments += 1
+        self._video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), self.fps, (width, height))
+        if self.output_format == "mjpeg":
+            self._video.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality)
+        self._segment_started = time.monotonic()
+        self._add_file(path)
+
+    def _close_video(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+    def _add_file(self, path):
+        # Rolling output: delete the oldest files beyond `keep`
+        self._files.append(path)
+        while self.keep and len(self._files) > self.keep:
+            oldest = self._files.pop(0)
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {"submitted": self.submitted, "written": self.written, "dropped": self.dropped, "pending": self._queue.qsize()}
+
+    def close(self):
+        """
+        Write the frames still queued, then close the current file.
+        """
+        self._queue.put(None)
+        self._worker.join()
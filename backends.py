@@ -0,0 +1,150 @@
+import numpy as np
+import cv2
+
+# YOLOv4 input sizes (multiples of its 32 pixel stride): smaller is faster, larger finds smaller vehicles
+INPUT_SIZES = (320, 416, 608)
+
+# OpenCV DNN settings by name, see cv2.dnn.DNN_BACKEND_* and cv2.dnn.DNN_TARGET_*
+DNN_BACKENDS = {
+    "default": cv2.dnn.DNN_BACKEND_DEFAULT,
+    "opencv": cv2.dnn.DNN_BACKEND_OPENCV,
+    "openvino": cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+    "cuda": cv2.dnn.DNN_BACKEND_CUDA
+}
+DNN_TARGETS = {
+    "cpu": cv2.dnn.DNN_TARGET_CPU,
+    "opencl": cv2.dnn.DNN_TARGET_OPENCL,
+    "opencl_fp16": cv2.dnn.DNN_TARGET_OPENCL_FP16,
+    "cuda": cv2.dnn.DNN_TARGET_CUDA,
+    "cuda_fp16": cv2.dnn.DNN_TARGET_CUDA_FP16
+}
+
+def make_blob(images, input_size):
+    """
+    Pre-process a list of BGR images into one YOLO input blob (scaled to 0-1, RGB, resized without cropping).
+    """
+    return cv2.dnn.blobFromImages(images, 0.00392, (input_size, input_size), (0, 0, 0), True, crop=False)
+
+def split_batch_outputs(outs, batch_len):
+    """
+    Split the outputs of a batched forward pass back into per-image outputs.
+    YOLO output layers return (rows, 85) for a single image and (batch, rows, 85) for a batch.
+    """
+    per_image = []
+    for i in range(batch_len):
+        per_image.append([
+            out[i] if out.ndim == 3 else out.reshape(batch_len, -1, out.shape[-1])[i]
+            for out in outs
+        ])
+    return per_image
+
+def darknet_rows(outputs):
+    """
+    Convert the outputs of a YOLOv4 ONNX model to darknet rows of [cx, cy, w, h, obj, scores...].
+    Accepts the common two-output export (boxes (N, A, 1, 4) as normalized [x1, y1, x2, y2],
+    class scores (N, A, C)) and single-output models that already produce darknet rows.
+    :return: Array (N, A, 5 + C).
+    """
+    if len(outputs) == 1:
+        rows = outputs[0]
+        return rows if rows.ndim == 3 else rows.reshape(1, -1, rows.shape[-1])
+
+    boxes, scores = outputs
+    boxes = boxes.reshape(boxes.shape[0], -1, 4)
+    centers = (boxes[..., :2] + boxes[..., 2:]) / 2
+    sizes = boxes[..., 2:] - boxes[..., :2]
+    # The export folds objectness into the class scores; the best score stands in for it
+    objectness = scores.max(axis=-1, keepdims=True)
+    return np.concatenate([centers, sizes, objectness, scores], axis=-1).astype(np.float32, copy=False)
+
+class OpenCVBackend:
+    """
+    YOLO on OpenCV DNN with an explicit backend and target.
+    """
+    name = "opencv"
+
+    def __init__(self, weights, config, backend="opencv", target="cpu", threads=None):
+        """
+        :param weights: Darknet weights (or any model cv2.dnn.readNet accepts).
+        :param config: Darknet config.
+        :param backend: Key of DNN_BACKENDS.
+        :param target: Key of DNN_TARGETS.
+        :param threads: OpenCV threads, None keeps OpenCV's default. This is a process-wide setting.
+        """
+        if threads is not None:
+            cv2.setNumThreads(threads)
+        self.net = cv2.dnn.readNet(weights, config)
+        self.net.setPreferableBackend(DNN_BACKENDS[backend])
+        self.net.setPreferableTarget(DNN_TARGETS[target])
+        layer_names = self.net.getLayerNames()
+        self.output_layers = [layer_names[i - 1] for i in self.net.getUnconnectedOutLayers()]
+
+    def infer(self, images, input_size):
+        """
+        Run one forward pass over a list of images.
+        :return: List with the outputs of each image, a list of (rows, 85) arrays for detector.postprocess.
+        """
+        self.net.setInput(make_blob(images, input_size))
+        return split_batch_outputs(self.net.forward(self.output_layers), len(images))
+
+class OnnxRuntimeBackend:
+    """
+    YOLO on ONNX Runtime's CPU provider. Int8-quantized models (from onnxruntime.quantization) load
+    like any other model, they still take a float input.
+    """
+    name = "onnxruntime"
+
+    def __init__(self, model_path, threads=None):
+        """
+        :param model_path: YOLOv4 ONNX model.
+        :param threads: Intra-op threads of the session, None lets ONNX Runtime decide.
+        """
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnxruntime backend needs the onnxruntime package (pip install onnxruntime).")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads is not None:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Dimensions exported as fixed ints can't change: the model runs at that size, one image at a time if batch is 1
+        batch, _, height, _ = model_input.shape
+        self.fixed_size = height if isinstance(height, int) else None
+        self.fixed_batch = batch if isinstance(batch, int) else None
+
+    def infer(self, images, input_size):
+        """
+        Run the model over a list of images, at the model's own size if it was exported with a fixed one.
+        :return: List with the outputs of each image, a list of (rows, 85) arrays for detector.postprocess.
+        """
+        blob = make_blob(images, self.fixed_size or input_size)
+        if self.fixed_batch == 1 and len(images) > 1:
+            rows = np.concatenate([self._run(blob[i:i + 1]) for i in range(len(images))])
+        else:
+            rows = self._run(blob)
+        return [[image_rows] for image_rows in rows]
+
+    def _run(self, blob):
+        return darknet_rows(self.session.run(None, {self.input_name: blob}))
+
+class AdaptiveInputSize:
+    """
+    Pick the network input size from the number of frames waiting for inference: the full size
+    while the queue keeps up, one size smaller for every `step` frames waiting.
+    """
+
+    def __init__(self, sizes=(416, 320), step=4):
+        """
+        :param sizes: Input sizes to choose from; a single size disables the adaptation.
+        :param step: Waiting frames per step down to the next smaller size.
+        """
+        self.sizes = sorted(sizes, reverse=True)
+        self.step = max(1, step)
+
+    def select(self, pending):
+        return self.sizes[min(pending // self.step, len(self.sizes) - 1)]
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+import cv2
+from backends import INPUT_SIZES
+from frame_codec import encode_frame, decode_payload
+from preprocess import decode_frame
+import timing_engine
+import calculate
+
+# Benchmark defaults, the quick variants keep a run under a minute for checking the harness itself
+FRAME_SIZE = (1280, 720)
+POSTPROCESS_ITERATIONS = 300
+DECODE_ITERATIONS = 200
+TIMING_INTERSECTIONS = (10_000, 50_000, 100_000)
+TIMING_ITERATIONS = 3
+SAVE_CHECKPOINTS = (1_000, 10_000, 50_000)
+TOLERANCE = 0.10  # Relative p50 slowdown against the baseline reported as a regression
+
+# COCO vehicle classes, so the benchmark doesn't need coco.names
+VEHICLE_CLASSES = {2: "car", 5: "bus", 7: "truck"}
+
+class StubBackend:
+    """
+    Detector backend returning fixed, realistic YOLOv4 outputs instead of running a network.
+    Each image gets three output layers of 3 * (size / stride)^2 rows of 85 values, for the strides
+    32, 16 and 8 (507, 2028 and 8112 rows at 416), with low background scores and a few confident,
+    partly overlapping vehicles for NMS to resolve.
+    """
+    name = "stub"
+
+    def __init__(self, vehicles=20, seed=0):
+        self.vehicles = vehicles
+        self.seed = seed
+        self._outputs = {}
+
+    def outputs(self, input_size):
+        if input_size not in self._outputs:
+            rng = np.random.default_rng(self.seed + input_size)
+            layers = []
+            for stride in (32, 16, 8):
+                rows = 3 * (input_size // stride) ** 2
+                out = np.empty((rows, 85), dtype=np.float32)
+                out[:, :2] = rng.random((rows, 2))
+                out[:, 2:4] = rng.uniform(0.02, 0.2, (rows, 2))
+                out[:, 4] = rng.random(rows) * 0.1
+                out[:, 5:] = rng.random((rows, 80)) * 0.05
+                layers.append(out)
+
+            # Confident vehicles, each found by a few neighbouring rows of the finest layer
+            finest = layers[-1]
+            for vehicle in range(self.vehicles):
+                class_id = rng.choice(list(VEHICLE_CLASSES))
+                center = rng.uniform(0.1, 0.9, 2)
+                for row in rng.choice(len(finest), 3, replace=False):
+                    finest[row, :2] = center + rng.normal(0, 0.003, 2)
+                    finest[row, 2:4] = (0.08, 0.06)
+                    finest[row, 4] = 0.9
+                    finest[row, 5 + class_id] = rng.uniform(0.65, 0.98)
+            self._outputs[input_size] = layers
+        return self._outputs[input_size]
+
+    def infer(self, images, input_size):
+        return [self.outputs(input_size) for _ in images]
+
+def synthetic_jpeg(width, height, seed=0, quality=85):
+    """
+    Encode a road-like test frame: a gradient with noise and vehicle-sized blocks, so the JPEG has a realistic size.
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(60, 160, height, dtype=np.float32)[:, None, None]
+    image = np.clip(gradient + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    for _ in range(25):
+        x, y = int(rng.integers(0, width - 120)), int(rng.integers(0, height - 80))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(image, (x, y), (x + int(rng.integers(60, 120)), y + int(rng.integers(40, 80))), color, -1)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+def summarize(durations, items=1):
+    """
+    Latency percentiles (ms) and throughput of a list of durations in seconds.
+    :param items: Items processed per call, for the items per second figure.
+    """
+    durations = np.asarray(durations)
+    mean = durations.mean()
+    return {
+        "iterations": len(durations),
+        "mean_ms": round(mean * 1000, 4),
+        "p50_ms": round(np.percentile(durations, 50) * 1000, 4),
+        "p99_ms": round(np.percentile(durations, 99) * 1000, 4),
+        "throughput_per_s": round(items / mean, 1) if mean else None
+    }
+
+def measure(func, iterations, warmup=3):
+    """
+    Call func repeatedly and return the duration of each call in seconds.
+    """
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def use_stub_classes():
+    """
+    Let car_det look up class labels without coco.names: placeholder labels for the 80 COCO ids,
+    with the vehicle labels at their ids. A real coco.names is used when there is one.
+    """
+    import models
+
+    if not os.path.exists(models.CLASS_NAMES):
+        models._classes = [VEHICLE_CLASSES.get(class_id, f"class{class_id}") for class_id in range(80)]
+        models._class_ids.clear()
+
+def bench_postprocess(iterations):
+    """
+    car_det.detect_vehicles with the stub backend: everything after the forward pass (class lookup, postprocess,
+    NMS, mapping the boxes back through the FrameTransform of a reduced decode, counting per row) and the stage wrappers.
+    """
+    import car_det
+
+    use_stub_classes()
+    backend = StubBackend()
+    buffer = np.frombuffer(synthetic_jpeg(*FRAME_SIZE), dtype=np.uint8)
+    results = {}
+    for input_size in INPUT_SIZES:
+        image, transform = decode_frame(buffer, 1, input_size)
+
+        def detect():
+            car_det.detect_vehicles(image, 1, backend, transform, input_size)
+
+        results[f"postprocess[{input_size}]"] = summarize(measure(detect, iterations))
+    return results
+
+def bench_decode(iterations):
+    """
+    The car_det frame decode path for each payload format: decode_payload, then the reduced-scale decode_frame.
+    """
+    jpeg = synthetic_jpeg(*FRAME_SIZE)
+    payloads = {
+        "raw": jpeg,
+        "header": encode_frame(jpeg, traffic_id=1),
+        "json": json.dumps({"image": base64.b64encode(jpeg).decode()}).encode()
+    }
+    results = {}
+    for name, payload in payloads.items():
+        def decode():
+            buffer, _ = decode_payload(payload)
+            decode_frame(buffer, None, 416)
+
+        results[f"decode[{name}]"] = summarize(measure(decode, iterations))
+    return results
+
+def bench_allocate_time(sizes, iterations):
+    """
+    Timing allocation over many intersections, the vectorized engine and the scalar calculate.allocate_time.
+    """
+    results = {}
+    for size in sizes:
+        traffic_data = timing_engine.random_traffic_data(size)
+        results[f"allocate_time[{size}]"] = summarize(
+            measure(lambda: timing_engine.allocate_time(traffic_data), iterations, warmup=1), size)
+        results[f"allocate_time_scalar[{size}]"] = summarize(
+            measure(lambda: calculate.allocate_time(traffic_data), iterations, warmup=1), size)
+    return results
+
+def bench_save(checkpoints):
+    """
+    car_det.save_message_to_file latency as the history grows, reported per history range
+    (e.g. save_message_to_file[10000] covers the appends from the previous checkpoint up to 10000 records).
+    """
+    import car_det
+    from traffic_store import TrafficStore
+
+    directory = tempfile.mkdtemp(prefix="saferoad-bench-")
+    previous_store = car_det.traffic_store
+    car_det.traffic_store = TrafficStore(directory)
+    message = timing_engine.random_traffic_data(1, max_rows=4)[0]
+    results = {}
+    try:
+        saved = 0
+        for checkpoint in checkpoints:
+            durations = []
+            while saved < checkpoint:
+                entry = dict(message, traffic_id=saved % 4 + 1)
+                start = time.perf_counter()
+                car_det.save_message_to_file(entry)
+                durations.append(time.perf_counter() - start)
+                saved += 1
+            results[f"save_message_to_file[{checkpoint}]"] = summarize(durations)
+    finally:
+        car_det.traffic_store.close()
+        car_det.traffic_store = previous_store
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def environment():
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__
+    }
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare p50 latencies against a baseline run.
+    :return: Dict {benchmark: {"p50_ms", "baseline_p50_ms", "change", "regression"}} for the benchmarks in both.
+    """
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("p50_ms"):
+            continue
+        change = float(result["p50_ms"] / base["p50_ms"] - 1)
+        comparison[name] = {
+            "p50_ms": result["p50_ms"],
+            "baseline_p50_ms": base["p50_ms"],
+            "change": round(change, 4),
+            "regression": change > tolerance
+        }
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for detection post-processing, frame decoding, timing allocation and persistence.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative p50 slowdown counted as a regression")
+    parser.add_argument("--only", nargs="+", choices=("postprocess", "decode", "allocate_time", "save"), help="Benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations and smaller sizes")
+    args = parser.parse_args()
+
+    scale = 10 if args.quick else 1
+    benchmarks = {
+        "postprocess": lambda: bench_postprocess(POSTPROCESS_ITERATIONS // scale),
+        "decode": lambda: bench_decode(DECODE_ITERATIONS // scale),
+        "allocate_time": lambda: bench_allocate_time([size // scale for size in TIMING_INTERSECTIONS], TIMING_ITERATIONS),
+        "save": lambda: bench_save([checkpoint // scale for checkpoint in SAVE_CHECKPOINTS])
+    }
+
+    results = {}
+    for name in args.only or benchmarks:
+        print(f"Running {name} benchmarks...")
+        for key, result in benchmarks[name]().items():
+            results[key] = result
+            print(f"  {key:<36} p50 {result['p50_ms']:>10.3f} ms  p99 {result['p99_ms']:>10.3f} ms  {result['throughput_per_s']:>12} /s")
+
+    report = {"environment": environment(), "results": results}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            comparison = compare(results, json.load(file)["results"], args.tolerance)
+        report["comparison"] = comparison
+        print(f"Compared with {args.baseline}:")
+        for key, entry in comparison.items():
+            flag = "REGRESSION" if entry["regression"] else ""
+            print(f"  {key:<36} {entry['change']:+8.1%}  {flag}")
+            if entry["regression"]:
+                regressions.append(key)
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results saved to {args.output}")
+
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
-import cv2
 import json
+import logging
 import numpy as np
 import paho.mqtt.client as mqtt
+from detector import postprocess, nms
+from models import get_model, get_input_size
+from preprocess import read_frame
+from mqtt_publisher import MqttPublisher
 
 # Constants for timing
 MIN_TIME = 2         # Minimum green light time in seconds
@@ -11,15 +15,16 @@ TRUCK_WEIGHT = 2.5   # Weighting factor for trucks
 MAX_TRAFFIC_TIME = 30  # Maximum allowed total time for each traffic light (not per row)
 STOP_LINE_DISTANCE = 2  # Example threshold for detecting vehicle crossing the stop line
 
-# Load YOLO
-net = cv2.dnn.readNet('yolov4.weights', 'yolov4.cfg')
-layer_names = net.getLayerNames()
-output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
+CAR_CLASS_IDS = np.array([2])  # 2 corresponds to 'car' class in COCO dataset
 
 # MQTT Configuration
 MQTT_BROKER = "broker.emqx.io"  # Replace with your broker address
 MQTT_PORT = 1883
-MQTT_TOPIC = "traffic/light/status"
+MQTT_TOPIC = "traffic/light/status"     # One {"traffic_id", "time"} object per message (read by the dashboard)
+TIMINGS_TOPIC = "traffic/light/timings"  # Batched timings: JSON lists of those objects
+PUBLISH_TIMEOUT = 10  # Seconds main() waits for the broker to acknowledge the timings
+
+logger = logging.getLogger(__name__)
 
 def detect_vehicles(image_path):
     """
@@ -27,44 +32,18 @@ def detect_vehicles(image_path):
     :param image_path: Path to the image file.
     :return: Integer count of vehicles detected.
     """
-    # Load the image
-    image = cv2.imread(image_path)
+    # Load the image (reduced-scale decode, only the count is returned)
+    image, _ = read_frame(image_path)
     height, width, channels = image.shape
     
-    # Prepare the image for YOLO model (scale and normalize)
-    blob = cv2.dnn.blobFromImage(image, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-    net.setInput(blob)
-    outs = net.forward(output_layers)
-
-    # Initialize lists to store detected vehicle details
-    class_ids = []
-    confidences = []
-    boxes = []
-
-    # Process detections
-    for out in outs:
-        for detection in out:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-            
-            # Filter for vehicles (class_id 2 corresponds to "car" in COCO dataset)
-            if confidence > 0.5 and class_id == 2:  # 2 corresponds to 'car' class in COCO dataset
-                center_x = int(detection[0] * width)
-                center_y = int(detection[1] * height)
-                w = int(detection[2] * width)
-                h = int(detection[3] * height)
-
-                # Rectangle coordinates
-                x = int(center_x - w / 2)
-                y = int(center_y - h / 2)
-
-                boxes.append([x, y, w, h])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
+    # Run the YOLO model (the backend scales and normalizes the image)
+    outs = get_model().infer([image], get_input_size())[0]
+
+    # Filter for vehicles (class_id 2 corresponds to "car" in COCO dataset)
+    boxes, confidences, class_ids = postprocess(outs, width, height, 0.5, CAR_CLASS_IDS)
 
     # Non-maximum suppression to remove duplicate boxes
-    indexes = cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)
+    indexes = nms(boxes, confidences, 0.5, 0.4)
 
     # Return the number of detected vehicles
     return len(indexes)
@@ -76,7 +55,7 @@ def allocate_time_per_row(cars_count, trucks_count, weather):
     Weather conditions also affect the time allocation.
     """
     effective_vehicle_count = cars_count + int(trucks_count * TRUCK_WEIGHT)
-    print(f"Effective Vehicle Count (Cars + Trucks): {effective_vehicle_count}")  # Debugging line
+    logger.debug("effective_vehicle_count=%d cars=%d trucks=%d", effective_vehicle_count, cars_count, trucks_count)
     
     # Adjust time based on weather conditions
     weather_factor = 1.0
@@ -107,7 +86,7 @@ def allocate_time(traffic_data):
         for row in traffic["rows"]:
             # Calculate row time considering both cars and trucks and weather
             row_time = allocate_time_per_row(row["cars"], row["trucks"], "foggy")
-            print(f"Row {row['row_id']} Time: {row_time}")  # Debugging line
+            logger.debug("traffic_id=%s row_id=%s row_time=%s", traffic["traffic_id"], row["row_id"], row_time)
             total_time += row_time
         
         # Apply the max time for each traffic light, not per row
@@ -137,16 +116,22 @@ def load_traffic_data(json_file):
     with open(json_file, "r") as file:
         return json.load(file)
 
-def send_timings_over_mqtt(client, timing_results):
+def send_timings_over_mqtt(publisher, timing_results, batch=False):
     """
     Send timing results over MQTT.
-    :param client: MQTT client instance.
+    :param publisher: MqttPublisher of the MQTT client.
     :param timing_results: List of timing data.
+    :param batch: Coalesce the timings into JSON lists on TIMINGS_TOPIC instead of one message each on MQTT_TOPIC.
     """
+    topic = TIMINGS_TOPIC if batch else MQTT_TOPIC
     for timing in timing_results:
-        message = json.dumps(timing)  # Convert timing data to JSON string
-        client.publish(MQTT_TOPIC, message)
-        print(f"Published to {MQTT_TOPIC}: {message}")
+        if batch:
+            publisher.add(topic, timing)
+        else:
+            publisher.publish(topic, timing)
+        logger.debug("Queued for %s: %s", topic, timing)
+    publisher.flush()
+    print(f"Published {len(timing_results)} timings to {topic}")
 
 def on_connect(client, userdata, flags, rc):
     print(f"Connected with result code {rc}")
@@ -157,12 +142,16 @@ def on_message(client, userdata, msg):
     print(f"Received message: {msg.payload.decode()}")
 
 def main():
+    # Row-level timing details are logged at DEBUG
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
     # Load traffic data from JSON
     json_file_path = "traffic_data.json"
     traffic_data = load_traffic_data(json_file_path)
     
-    # Calculate timings
-    timing_results = allocate_time(traffic_data)
+    # Calculate timings (vectorized, same results as allocate_time)
+    import timing_engine
+    timing_results = timing_engine.allocate_time(traffic_data)
     
     # Setup MQTT client
     client = mqtt.Client()
@@ -180,8 +169,11 @@ def main():
     # Start MQTT loop in the background
     client.loop_start()
 
-    # Publish timings over MQTT
-    send_timings_over_mqtt(client, timing_results)
+    # Publish timings over MQTT, and wait for the broker to acknowledge them before moving on
+    publisher = MqttPublisher(client)
+    send_timings_over_mqtt(publisher, timing_results)
+    if not publisher.wait(PUBLISH_TIMEOUT):
+        print(f"Timings not acknowledged within {PUBLISH_TIMEOUT}s: {publisher.stats()}")
     
     # Detect violation example (optional)
     image_path = "images/image2.jpg"
@@ -201,5 +193,9 @@ def main():
 
     print("Results have been written to output_results.json")
 
+    publisher.close(PUBLISH_TIMEOUT)
+    client.loop_stop()
+    client.disconnect()
+
 if __name__ == "__main__":
     main()
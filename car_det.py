@@ -1,184 +1,461 @@
-import cv2
-import numpy as np
-import base64
+import re
+import sys
 import json
 import paho.mqtt.client as mqtt
+import time
+import signal
+import argparse
+import threading
 from datetime import datetime
-
-# YOLO model setup (Assuming you have YOLOv4 model files)
-net = cv2.dnn.readNet('yolov4.weights', 'yolov4.cfg')
-layer_names = net.getLayerNames()
-output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
-
-# Load class labels
-with open("coco.names", "r") as f:
-    classes = [line.strip() for line in f.readlines()]
-
-# Constants for rows (Row boundaries as pixel heights)
-ROW_BOUNDARIES = [
-    (0, 200),   # Row 1 (top boundary, bottom boundary)
-    (200, 400), # Row 2
-    (400, 600), # Row 3
-    (600, 800)  # Row 4 (if applicable)
-]
-
-def detect_vehicles(image, traffic_id):
+from detector import VEHICLE_LABELS, postprocess, nms
+from models import get_model, get_classes, get_class_ids, get_input_size, load_model, warm_up, add_model_arguments, configure, configure_from_args
+from backends import INPUT_SIZES, AdaptiveInputSize
+from frame_queue import FrameQueue
+from frame_cache import FrameCache, payload_key
+from frame_codec import decode_payload, split_header
+from preprocess import decode_frame
+from motion_gate import MotionGate
+from traffic_store import STORE_DIR, TrafficStore
+from tracker import VehicleTracker
+from lanes import get_lane_map
+from hash_ring import parse_camera_ids, worker_ring
+from violations import LIGHT_COLOR_TOPIC, ViolationEngine, publish_violations
+from mqtt_publisher import QOS, FLUSH_INTERVAL, MqttPublisher
+from live_traffic import live_traffic, serve_live_traffic
+from metrics import METRICS_PORT, STATS_INTERVAL, STATS_TOPIC, metrics, serve_metrics, start_stats_publisher
+
+# Inference pipeline settings
+INFERENCE_WORKERS = 2     # Worker threads, each with its own YOLO net
+MAX_PENDING_FRAMES = 64   # Cameras that can have a frame waiting at the same time
+STATS_EVERY = 100         # Print the queue counters every N processed frames
+MOTION_THRESHOLD = 4.0    # Scene change score below which the previous result is reused (0 disables)
+DETECT_EVERY = 3          # Run YOLO on every N-th frame of a camera, track in between (1 detects every frame)
+STOP_LINE = 0.75          # Height of the stop line vehicles are counted at, as a fraction of the frame (top of row 4)
+ADAPTIVE_INPUT_SIZES = (416, 320)  # Network input sizes used as the frame queue grows, largest first
+PENDING_PER_SIZE_STEP = 4          # Waiting frames per step down to the next smaller input size
+SHUTDOWN_TIMEOUT = 5      # Seconds given to the publisher to deliver its last messages on exit
+
+# Camera frames arrive on traffic/light/image{traffic_id}; the wildcard also matches other
+# traffic/light/ topics (e.g. the timings on traffic/light/status), which the pattern leaves out,
+# except the light colors on LIGHT_COLOR_TOPIC feeding the violation check
+IMAGE_TOPIC_FILTER = "traffic/light/+"
+IMAGE_TOPIC_PATTERN = re.compile(r"^traffic/light/image(\d+)$")
+COUNTS_TOPIC = "traffic/vehicle_counts"  # Batched counts of every camera (--batch-counts), see timing_controller.py
+BROKER = "broker.emqx.io"
+BROKER_PORT = 1883
+
+# Frames received from MQTT, waiting for an inference worker
+frame_queue = FrameQueue(MAX_PENDING_FRAMES)
+
+# Per-camera change detector deciding which frames need a YOLO pass
+motion_gate = MotionGate(MOTION_THRESHOLD)
+
+# Results of recently seen payloads (assign the proxy from frame_cache.start_shared_cache() to share it between processes)
+frame_cache = FrameCache()
+
+# Per-camera vehicle trackers, {traffic_id: {"tracker", "frames"}}
+camera_trackers = {}
+
+# Red-light violations from the camera tracks, with the light phases fed by the colors on LIGHT_COLOR_TOPIC
+violation_engine = ViolationEngine()
+
+# Trades a little accuracy for throughput when frames pile up
+input_sizes = AdaptiveInputSize(ADAPTIVE_INPUT_SIZES, PENDING_PER_SIZE_STEP)
+
+# When several car_det processes split the cameras by consistent hashing (see hash_ring.py), the ring
+# and this process's node on it; None takes every camera
+camera_ring = None
+ring_node = None
+
+# Coalescing publisher of the counts (set up by main); batch_counts sends JSON lists on COUNTS_TOPIC
+# instead of the latest count of each camera on its own topic
+publisher = None
+batch_counts = False
+
+def find_vehicles(image, model=None, transform=None, input_size=None, traffic_id=None):
     """
-    Detect vehicles in an image and count them per row, and also count the total number of cars and trucks.
+    Run YOLO on an image and return the vehicles it finds.
+    :param model: Optional detector from load_model(), defaults to the shared model.
+    :param transform: Optional preprocess.FrameTransform mapping the boxes back to the original frame.
+    :param input_size: Network input size, defaults to the configured one.
+    :param traffic_id: Camera the stage timings are recorded for.
+    :return: Tuple (boxes, labels) with boxes as an (N, 4) int array of [x, y, w, h].
     """
     height, width, _ = image.shape
 
-    # Pre-process the image for YOLO
-    blob = cv2.dnn.blobFromImage(image, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-    net.setInput(blob)
-    outs = net.forward(output_layers)
+    # Run YOLO (the backend pre-processes the image)
+    with metrics.stage("inference", traffic_id):
+        outs = (model or get_model()).infer([image], input_size or get_input_size())[0]
 
     # Analyze detections
-    class_ids, confidences, boxes = [], [], []
-    for out in outs:
-        for detection in out:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-            if confidence > 0.6 and classes[class_id] in ["car", "bus", "truck"]:
-                # Get bounding box coordinates
-                center_x = int(detection[0] * width)
-                center_y = int(detection[1] * height)
-                w = int(detection[2] * width)
-                h = int(detection[3] * height)
-                x = int(center_x - w / 2)
-                y = int(center_y - h / 2)
-
-                boxes.append([x, y, w, h])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
+    with metrics.stage("postprocess", traffic_id):
+        boxes, confidences, class_ids = postprocess(outs, width, height, 0.6, get_class_ids(VEHICLE_LABELS))
 
     # Apply Non-Maximum Suppression
-    indices = cv2.dnn.NMSBoxes(boxes, confidences, 0.6, 0.3)
+    with metrics.stage("nms", traffic_id):
+        indices = nms(boxes, confidences, 0.6, 0.3)
+
+    classes = get_classes()
+    boxes = boxes[indices] if transform is None else transform.to_original(boxes[indices])
+    return boxes, [classes[class_id] for class_id in class_ids[indices]]
+
+def count_rows(traffic_id, boxes, labels, width, height):
+    """
+    Count the cars and trucks per row, and also the total number of cars and trucks.
+    Rows are the camera's lanes (see lanes.py) compiled for the frame resolution.
+    """
+    with metrics.stage("count_rows", traffic_id):
+        lane_map = get_lane_map(traffic_id, width, height)
+        cars, trucks = lane_map.count(boxes, labels)
 
     # Count vehicles in each row
-    row_counts = [{"row_id": i + 1, "cars": 0, "trucks": 0} for i in range(len(ROW_BOUNDARIES))]
-
-    # Initialize total vehicle counters
-    total_cars = 0
-    total_trucks = 0
-
-    for i in indices.flatten():
-        x, y, w, h = boxes[i]
-        label = classes[class_ids[i]]
-
-        # Determine the row of the detection based on the y-coordinate
-        for row_id, (top, bottom) in enumerate(ROW_BOUNDARIES):
-            if top <= y + h // 2 < bottom:  # Vehicle is in this row
-                if label == "car":
-                    row_counts[row_id]["cars"] += 1
-                    total_cars += 1
-                elif label in ["bus", "truck"]:
-                    row_counts[row_id]["trucks"] += 1
-                    total_trucks += 1
+    row_counts = [
+        {"row_id": row_id, "cars": int(row_cars), "trucks": int(row_trucks)}
+        for row_id, row_cars, row_trucks in zip(lane_map.row_ids, cars, trucks)
+    ]
 
     # Add the total count to the result
     result = {
         "traffic_id": traffic_id,
         "rows": row_counts,
         "total": {
-            "cars": total_cars,
-            "trucks": total_trucks
+            "cars": int(cars.sum()),
+            "trucks": int(trucks.sum())
         }
     }
 
     return result
 
+def frame_size(image, transform=None):
+    """
+    Size of the original camera frame as (width, height).
+    """
+    if transform is not None:
+        return transform.width, transform.height
+    height, width = image.shape[:2]
+    return width, height
+
+def detect_vehicles(image, traffic_id, model=None, transform=None, input_size=None):
+    """
+    Detect vehicles in an image and count them per row, and also count the total number of cars and trucks.
+    :param model: Optional detector from load_model(), defaults to the shared model.
+    :param transform: Optional preprocess.FrameTransform of a reduced or cropped image.
+    """
+    boxes, labels = find_vehicles(image, model, transform, input_size, traffic_id)
+    return count_rows(traffic_id, boxes, labels, *frame_size(image, transform))
+
+def track_vehicles(image, traffic_id, model=None, transform=None, input_size=None):
+    """
+    Count vehicles from the camera's tracks. YOLO runs on every DETECT_EVERY-th frame of a camera,
+    the frames in between only move the tracks along, so counts stay stable between detections.
+    """
+    width, height = frame_size(image, transform)
+    camera = camera_trackers.get(traffic_id)
+    if camera is None:
+        camera = camera_trackers[traffic_id] = {"tracker": VehicleTracker(int(STOP_LINE * height)), "frames": 0}
+    tracker = camera["tracker"]
+
+    detected = camera["frames"] % DETECT_EVERY == 0
+    if detected:
+        tracker.update(*find_vehicles(image, model, transform, input_size, traffic_id))
+    else:
+        tracker.predict()
+    camera["frames"] += 1
+
+    result = count_rows(traffic_id, *tracker.boxes(), width, height)
+    result["tracking"] = {
+        "detected": detected,
+        "vehicles": len(tracker.tracks),
+        "crossings": tracker.crossings
+    }
+    return result, detected
+
+def check_violations(traffic_id, width, height):
+    """
+    Check the camera's tracks observed on this frame against its stop line (predicted positions are skipped).
+    :return: List of violation events, always empty while the light isn't red.
+    """
+    if violation_engine.phases.red_since(traffic_id) is None:
+        return []
+    with metrics.stage("violations", traffic_id):
+        return violation_engine.check_tracks(traffic_id, camera_trackers[traffic_id]["tracker"].tracks, width, height)
+
+def topic_to_traffic_id(topic):
+    """
+    Map an image topic to its traffic light id, or None for unknown topics.
+    """
+    match = IMAGE_TOPIC_PATTERN.match(topic)
+    return int(match.group(1)) if match else None
+
+def owns_camera(traffic_id):
+    """
+    Whether this process handles the camera. Each camera belongs to exactly one worker of the ring,
+    so its frames stay in order and its tracker and motion gate state stay in one place.
+    """
+    return camera_ring is None or camera_ring.node_for(traffic_id) == ring_node
+
+def image_topics(cameras=None, share_group=None):
+    """
+    Topics to subscribe to: the wildcard, or one topic per owned camera when the cameras are known,
+    so a worker of a ring doesn't receive frames it would drop. A share group turns them into
+    MQTT shared subscriptions ($share/<group>/...), where the broker splits the frames between the group's members.
+    Frames of one camera only stay with one member if the broker hashes shared messages by topic
+    (e.g. EMQX's hash_topic strategy); Mosquitto deals them out in turn, use the hash ring there.
+    """
+    if cameras:
+        topics = [f"traffic/light/image{traffic_id}" for traffic_id in cameras if owns_camera(traffic_id)]
+    else:
+        topics = [IMAGE_TOPIC_FILTER]
+    if share_group:
+        topics = [f"$share/{share_group}/{topic}" for topic in topics]
+    return topics
+
 # Callback function to handle MQTT messages for each traffic light
 def on_message(client, userdata, msg):
-    topic = msg.topic
-    print(f"Message received on topic: {topic}")  # Print the topic
+    """
+    Runs on paho's network thread, so it only queues the frame (with its arrival time) for the inference workers.
+    Colors on LIGHT_COLOR_TOPIC update the light phases the violation check runs on. Retained colors
+    are stored by the broker from some earlier time, so they are ignored rather than taken as current.
+    """
+    if msg.topic == LIGHT_COLOR_TOPIC:
+        if msg.retain:
+            return
+        try:
+            violation_engine.phases.on_color(json.loads(msg.payload))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Invalid light color message skipped: {e}")
+        return
+    traffic_id = topic_to_traffic_id(msg.topic)
+    if traffic_id and owns_camera(traffic_id):
+        frame_queue.put(traffic_id, (msg.payload, time.perf_counter()))
+
+def process_frame(client, traffic_id, raw_payload, model):
+    """
+    Decode one queued frame, run detection on it, then publish and save the result.
+    """
+    print(f"Processing frame for traffic light {traffic_id}")
+    with metrics.stage("frame", traffic_id):
+        _process_frame(client, traffic_id, raw_payload, model)
 
-    # Printing the payload of the message
+def _process_frame(client, traffic_id, raw_payload, model):
+    # Byte-identical images get the cached result, without decoding the payload at all.
+    # Headered frames are keyed on their JPEG bytes only, the header's capture time changes every frame
     try:
-        payload = json.loads(msg.payload.decode())
-        print(f"Payload: {json.dumps(payload, indent=4)}")  # Print the JSON payload
-    except json.JSONDecodeError:
-        print("Payload could not be decoded as JSON.")
-
-    traffic_id = None
-
-    if topic == 'traffic/light/image1':
-        traffic_id = 1
-    elif topic == 'traffic/light/image2':
-        traffic_id = 2
-    elif topic == 'traffic/light/image3':
-        traffic_id = 3
-    elif topic == 'traffic/light/image4':
-        traffic_id = 4
-
-    if traffic_id:
-        image_data = payload['image']
-        
-        # Decode the base64 image
-        img_data = base64.b64decode(image_data)
-        np_img = np.frombuffer(img_data, dtype=np.uint8)
-        image = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-
-        # Call the vehicle detection function
-        traffic_entry = detect_vehicles(image, traffic_id)
-
-        # Send the result back over MQTT to the corresponding topic
-        client.publish(f'traffic/vehicle_count{traffic_id}', json.dumps(traffic_entry))
-
-        # Save the message to a JSON file
-        save_message_to_file(traffic_entry)
+        body, header = split_header(raw_payload, traffic_id)
+    except ValueError as e:
+        print(f"Frame for traffic light {traffic_id} skipped: {e}")
+        return
+    cache_key = payload_key(traffic_id, body)
+    traffic_entry = frame_cache.get(cache_key)
+    if traffic_entry is not None:
+        traffic_entry["motion"] = {"changed": False, "score": 0.0}
+        if header is not None:
+            traffic_entry["captured_at"] = header["captured_at"]
+        publish_and_save(client, traffic_id, traffic_entry)
+        return
+
+    # Raw JPEG payloads are decoded straight from the message buffer, base64 JSON is still accepted
+    try:
+        with metrics.stage("decode_payload", traffic_id):
+            np_img, frame_info = decode_payload(raw_payload, traffic_id)
+    except ValueError as e:
+        print(f"Frame for traffic light {traffic_id} skipped: {e}")
+        return
+    # Smaller network input while frames are waiting, so the queue drains faster at peak load
+    input_size = input_sizes.select(frame_queue.stats()["pending"])
+
+    # Decode at the smallest scale the network can use, cropped to the camera's region of interest
+    with metrics.stage("imdecode", traffic_id):
+        image, transform = decode_frame(np_img, traffic_id, input_size)
+    if image is None:
+        print(f"Frame for traffic light {traffic_id} could not be decoded as an image.")
+        return
+
+    # Skip YOLO when the scene hasn't changed since the last inferred frame of this camera
+    with metrics.stage("motion_gate", traffic_id):
+        changed, score, traffic_entry = motion_gate.check(traffic_id, image)
+    if changed:
+        # Call the vehicle detection function (through the camera's tracker)
+        traffic_entry, detected = track_vehicles(image, traffic_id, model, transform, input_size)
+        if detected:
+            motion_gate.record(traffic_id, traffic_entry)
+        # Vehicles only move while the scene changes, so unchanged frames can't add violations
+        publish_violations(client, check_violations(traffic_id, *frame_size(image, transform)))
+    frame_cache.put(cache_key, traffic_entry)
+
+    # Record the change detector's decision with the result
+    traffic_entry["motion"] = {
+        "changed": changed,
+        "score": None if score is None else round(score, 2)
+    }
+    if "captured_at" in frame_info:
+        traffic_entry["captured_at"] = frame_info["captured_at"]
+    publish_and_save(client, traffic_id, traffic_entry)
 
+def publish_and_save(client, traffic_id, traffic_entry):
+    """
+    Publish a traffic entry to its vehicle count topic and save it.
+    """
+    # Send the result back over MQTT to the corresponding topic, or queue it for the next flush
+    with metrics.stage("publish", traffic_id):
+        if publisher is None:
+            client.publish(f'traffic/vehicle_count{traffic_id}', json.dumps(traffic_entry))
+        elif batch_counts:
+            publisher.add(COUNTS_TOPIC, traffic_entry)
+        else:
+            publisher.set(f'traffic/vehicle_count{traffic_id}', traffic_entry)
+
+    # Save the message to the traffic store
+    with metrics.stage("save", traffic_id):
+        save_message_to_file(traffic_entry)
 
+    # Update the rolling aggregates served to the dashboard
+    live_traffic.add(traffic_entry)
 
-import os
+def inference_worker(client, model):
+    """
+    Drain the frame queue until the process exits.
+    """
+    while True:
+        traffic_id, (raw_payload, received_at) = frame_queue.get()
+        metrics.observe("queue_wait", traffic_id, time.perf_counter() - received_at)
+        try:
+            process_frame(client, traffic_id, raw_payload, model)
+        except Exception as e:
+            print(f"Error processing frame for traffic light {traffic_id}: {e}")
+        finally:
+            frame_queue.done(traffic_id)
+
+        stats = frame_queue.stats()
+        if stats["processed"] % STATS_EVERY == 0:
+            print(f"Frame queue stats: {stats}")
+            print(f"Frame cache stats: {frame_cache.stats()}")
+
+def start_inference_workers(client, count=INFERENCE_WORKERS):
+    """
+    Start the inference worker threads. The first one uses the shared model, the others load their own.
+    Each model is warmed up at every input size before its worker starts taking frames.
+    """
+    for i in range(count):
+        model = get_model() if i == 0 else load_model()
+        warm_up(model, input_sizes.sizes)
+        worker = threading.Thread(target=inference_worker, args=(client, model), daemon=True)
+        worker.start()
+
+# Append-only store for the detection results, opened on first use.
+# Every car_det process needs a directory of its own (see launcher.py).
+store_dir = STORE_DIR
+traffic_store = None
+store_lock = threading.Lock()
+
+def get_traffic_store():
+    global traffic_store
+    with store_lock:
+        if traffic_store is None:
+            traffic_store = TrafficStore(store_dir)
+        return traffic_store
 
 def save_message_to_file(message):
     """
-    Save the incoming message to a JSON file as an array of objects.
-    Create the file if it doesn't exist and ensure proper JSON formatting.
+    Save the incoming message to the append-only traffic store.
+    Run `python traffic_store.py export` to write traffic_data.json as an array of objects.
     """
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     message["timestamp"] = timestamp
 
     try:
-        # File path
-        file_path = 'traffic_data.json'
-
-        # Check if the file exists, if not create an empty JSON array
-        if not os.path.exists(file_path):
-            with open(file_path, 'w') as file:
-                json.dump([], file)
-
-        # Read existing data
-        with open(file_path, 'r') as file:
-            try:
-                data = json.load(file)  # Load existing JSON data
-            except json.JSONDecodeError:
-                data = []  # Initialize as empty list if file is invalid
-
-        # Append the new message to the list
-        data.append(message)
-
-        # Write the updated list back to the file
-        with open(file_path, 'w') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
-
-        print("Message saved successfully.")
+        get_traffic_store().append(message)
     except Exception as e:
         print(f"Error saving message: {e}")
 
-
-# MQTT setup
-client = mqtt.Client()
-client.on_message = on_message
-client.connect("broker.emqx.io", 1883, 60)
-
-# Subscribe to all the traffic light image topics
-client.subscribe("traffic/light/image1")
-client.subscribe("traffic/light/image2")
-client.subscribe("traffic/light/image3")
-client.subscribe("traffic/light/image4")
-
-# Start the MQTT loop
-client.loop_forever()
+def main():
+    global input_sizes, camera_ring, ring_node, store_dir, publisher, batch_counts
+    parser = argparse.ArgumentParser(description="Count vehicles on the traffic light camera frames received over MQTT.")
+    add_model_arguments(parser)
+    parser.add_argument("--threads", type=int, help="Inference threads of each model, defaults to the library's own")
+    parser.add_argument("--adaptive-sizes", type=int, nargs="+", choices=INPUT_SIZES, default=ADAPTIVE_INPUT_SIZES,
+                        help="Input sizes to step through as the frame queue grows")
+    parser.add_argument("--fixed-size", action="store_true", help="Always use --input-size instead of adapting to the queue")
+    parser.add_argument("--metrics", action="store_true", help="Record per-stage latency histograms")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Local HTTP port for /metrics, 0 disables it")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help=f"Seconds between stats messages on {STATS_TOPIC}, 0 disables them")
+    parser.add_argument("--broker", default=BROKER, help="MQTT broker host")
+    parser.add_argument("--port", type=int, default=BROKER_PORT, help="MQTT broker port")
+    parser.add_argument("--cameras", type=parse_camera_ids,
+                        help="Camera ids like 1-200,305 to subscribe to one by one instead of the wildcard "
+                             "(with --worker-count, only the owned ones: without it every worker receives every frame)")
+    parser.add_argument("--worker-index", type=int, default=0, help="Index of this process among the --worker-count workers")
+    parser.add_argument("--worker-count", type=int, default=1, help="Workers splitting the cameras by consistent hashing on traffic_id")
+    parser.add_argument("--share-group", help="Split frames through an MQTT shared subscription group instead of hashing")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="Traffic store directory of this process")
+    parser.add_argument("--live-port", type=int, default=0, help="Local HTTP port for /api/live-traffic, 0 disables it")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=QOS, help="QoS of the published counts")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="Seconds between count messages; a camera's counts in between are coalesced into the latest")
+    parser.add_argument("--batch-counts", action="store_true",
+                        help=f"Publish the counts of every camera as JSON lists on {COUNTS_TOPIC}")
+    args = parser.parse_args()
+    if args.share_group and args.worker_count > 1:
+        parser.error("--share-group and --worker-count split the cameras in different ways, use one of them")
+    if not 0 <= args.worker_index < max(1, args.worker_count):
+        parser.error("--worker-index must be below --worker-count")
+    configure_from_args(args)
+    configure(threads=args.threads)
+    input_sizes = AdaptiveInputSize((args.input_size,) if args.fixed_size else args.adaptive_sizes, PENDING_PER_SIZE_STEP)
+    store_dir = args.store_dir
+    if args.worker_count > 1:
+        camera_ring = worker_ring(args.worker_count)
+        ring_node = f"worker-{args.worker_index}"
+
+    # MQTT setup
+    client = mqtt.Client()
+    client.on_message = on_message
+    topics = image_topics(args.cameras, args.share_group)
+    if not topics:
+        parser.error("None of the --cameras belong to this worker")
+    if IMAGE_TOPIC_FILTER not in topics:
+        # Every worker follows the colors of all lights (never through the share group)
+        topics.append(LIGHT_COLOR_TOPIC)
+    # Subscribe on every (re)connect, so the subscriptions survive broker restarts
+    client.on_connect = lambda client, userdata, flags, rc: client.subscribe([(topic, 0) for topic in topics])
+    publisher = MqttPublisher(client, args.qos, flush_interval=args.flush_interval)
+    batch_counts = args.batch_counts
+
+    # Stage timings are only recorded when asked for, they cost nothing otherwise
+    if args.metrics:
+        metrics.enabled = True
+        if args.metrics_port:
+            serve_metrics(metrics, args.metrics_port)
+        if args.stats_interval > 0:
+            start_stats_publisher(client, metrics, STATS_TOPIC, args.stats_interval,
+                                  lambda: {"frame_queue": frame_queue.stats(), "frame_cache": frame_cache.stats(),
+                                           "publisher": publisher.stats()})
+
+    # The live traffic endpoint answers from memory, on its own threads
+    if args.live_port:
+        serve_live_traffic(live_traffic, args.live_port)
+
+    # Inference runs on worker threads so the network loop only receives frames.
+    # Their models are loaded and warmed up before we connect and start taking traffic.
+    start_inference_workers(client)
+    client.connect(args.broker, args.port, 60)
+
+    # launcher.py stops workers with SIGTERM: exit through the finally below, like on Ctrl+C,
+    # so the buffered records are saved and the last counts published
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # Start the MQTT loop
+    try:
+        client.loop_forever()
+    finally:
+        if traffic_store is not None:
+            traffic_store.close()
+        # The network loop stopped with loop_forever, run it in the background while the publisher drains
+        client.loop_start()
+        publisher.close(SHUTDOWN_TIMEOUT)
+        client.loop_stop()
+        client.disconnect()
+
+if __name__ == "__main__":
+    main()
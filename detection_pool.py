@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+import os
+import re
+import json
+import argparse
+import functools
+import multiprocessing
+import models
+from frame_cache import payload_key, start_shared_cache
+from preprocess import decode_frame
+
+# Pool defaults: one process per core, each with a single OpenCV thread
+WORKERS = os.cpu_count() or 1
+THREADS_PER_WORKER = 1
+CHUNK_SIZE = 8  # Images handed to a worker at a time (also its forward pass batch size)
+
+# Frames replayed from disk are named like the MQTT topics they came from (image1.jpg -> traffic_id 1)
+REPLAY_NAME_PATTERN = re.compile(r"image(\d+)\.(?:jpg|jpeg|png)$")
+
+# Result cache shared by the replay workers, set by the pool initializer
+_cache = None
+
+def _init_worker(threads, cache=None, settings=None):
+    """
+    Pool initializer: limit OpenCV's own thread pool and load this worker's YOLO net.
+    The net is the process-wide shared model, so every worker process holds exactly one.
+    :param settings: Detector backend settings of the parent (models.get_settings()), spawned workers don't inherit them.
+    """
+    global _cache
+    cv2.setNumThreads(threads)
+    _cache = cache
+    models.configure(**dict(settings or {}, threads=threads))
+    models.warm_up()
+
+def _count_chunk(image_paths, reduced=False):
+    import cars_detection
+    images = [cars_detection.load_image(path, reduced) for path in image_paths]
+    return cars_detection.detect_batch(images)
+
+def _replay_frame(path, traffic_id):
+    import car_det
+    data = np.fromfile(path, dtype=np.uint8)
+    if _cache is None:
+        image, transform = decode_frame(data, traffic_id)
+        return car_det.detect_vehicles(image, traffic_id, transform=transform)
+
+    # Identical files are looked up by their raw bytes before decoding
+    key = payload_key(traffic_id, data)
+    result = _cache.get(key)
+    if result is None:
+        image, transform = decode_frame(data, traffic_id)
+        result = car_det.detect_vehicles(image, traffic_id, transform=transform)
+        _cache.put(key, result)
+    return result
+
+def _replay_chunk(frames):
+    return [_replay_frame(path, traffic_id) for path, traffic_id in frames]
+
+def _get_context():
+    # Fork lets workers start from the already imported modules; fall back to spawn where it is missing.
+    # Models are loaded lazily per process, so nothing heavy is copied into the workers.
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def _run_chunks(func, items, workers, threads, chunk_size, cache=None):
+    """
+    Run func over chunks of items in a process pool and return the flattened results in input order.
+    """
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results = []
+    initargs = (threads, cache, models.get_settings())
+    with _get_context().Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        # imap keeps the chunk order, so results come back in the order of the input
+        for chunk_results in pool.imap(func, chunks):
+            results.extend(chunk_results)
+    return results
+
+def process_folder(folder, workers=WORKERS, threads=THREADS_PER_WORKER, chunk_size=CHUNK_SIZE, reduced=False):
+    """
+    Parallel version of cars_detection.process_folder.
+    :param reduced: Reduced-scale decoding, see cars_detection.load_image.
+    :return: List of {"traffic_id", "cars", "trucks"} dicts, identical in order and IDs to the single-process scan.
+    """
+    from cars_detection import list_images
+
+    counts = _run_chunks(functools.partial(_count_chunk, reduced=reduced), list_images(folder), workers, threads, chunk_size)
+    return [
+        {"traffic_id": traffic_id, "cars": car_count, "trucks": truck_count}
+        for traffic_id, (car_count, truck_count) in enumerate(counts, start=1)
+    ]
+
+def list_replay_frames(folder):
+    """
+    List recorded frames as (path, traffic_id) pairs, sorted by file name for a deterministic order.
+    """
+    frames = []
+    for image_name in sorted(os.listdir(folder)):
+        match = REPLAY_NAME_PATTERN.search(image_name)
+        if match:
+            frames.append((os.path.join(folder, image_name), int(match.group(1))))
+    return frames
+
+def replay_folder(folder, workers=WORKERS, threads=THREADS_PER_WORKER, chunk_size=CHUNK_SIZE, cache=False):
+    """
+    Replay recorded traffic/light/imageN frames through car_det.detect_vehicles in parallel.
+    :param cache: Share a frame cache between the workers, so byte-identical frames are only inferred once.
+    :return: List of per-frame traffic entries in file name order.
+    """
+    if not cache:
+        return _run_chunks(_replay_chunk, list_replay_frames(folder), workers, threads, chunk_size)
+
+    manager, shared_cache = start_shared_cache()
+    try:
+        results = _run_chunks(_replay_chunk, list_replay_frames(folder), workers, threads, chunk_size, shared_cache)
+        print(f"Frame cache stats: {shared_cache.stats()}")
+        return results
+    finally:
+        manager.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run vehicle detection over a folder with a process pool.")
+    parser.add_argument("--input", default="images/", help="Folder with the images to process")
+    parser.add_argument("--output", default="traffic_results.json", help="JSON file to write the results to")
+    parser.add_argument("--replay", action="store_true", help="Replay imageN frames through car_det instead of counting totals")
+    parser.add_argument("--cache", action="store_true", help="Share a frame cache between replay workers")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Number of worker processes")
+    parser.add_argument("--threads", type=int, default=THREADS_PER_WORKER, help="Inference threads per worker")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Images per task sent to a worker")
+    parser.add_argument("--reduced-decode", action="store_true",
+                        help="Decode JPEGs at reduced scale when counting: faster, but the counts can differ from a full-resolution scan")
+    models.add_model_arguments(parser)
+    args = parser.parse_args()
+    models.configure_from_args(args)
+
+    workers, threads, chunk_size = max(1, args.workers), max(1, args.threads), max(1, args.chunk_size)
+    if args.replay:
+        results = replay_folder(args.input, workers, threads, chunk_size, args.cache)
+    else:
+        results = process_folder(args.input, workers, threads, chunk_size, args.reduced_decode)
+
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=4)
+
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+
+# Labels counted as vehicles by the detection scripts
+VEHICLE_LABELS = ("car", "bus", "truck")
+TRUCK_LABELS = ("bus", "truck")
+
+def class_ids_for(classes, labels):
+    """
+    Look up the class ids of the given labels once, so detections can be filtered
+    with an array comparison instead of a string lookup per candidate.
+    :param classes: List of class names (e.g. the lines of coco.names).
+    :param labels: Labels to keep.
+    :return: Sorted int array of class ids.
+    """
+    return np.array(sorted(i for i, name in enumerate(classes) if name in labels), dtype=np.intp)
+
+def postprocess(outs, width, height, conf_threshold, class_ids=None):
+    """
+    Filter the raw YOLO outputs and convert the surviving rows to pixel boxes.
+    All candidate rows of every output layer are handled as one array.
+    :param outs: Output of net.forward(output_layers), rows of [cx, cy, w, h, obj, scores...].
+    :param width: Width of the source image in pixels.
+    :param height: Height of the source image in pixels.
+    :param conf_threshold: Minimum class score for a detection to be kept.
+    :param class_ids: Optional array of class ids to keep, None keeps every class.
+    :return: Tuple (boxes, confidences, class_ids) with boxes as an (N, 4) int array of [x, y, w, h].
+    """
+    detections = np.concatenate([out.reshape(-1, out.shape[-1]) for out in outs])
+    scores = detections[:, 5:]
+    detected_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), detected_ids]
+
+    keep = confidences > conf_threshold
+    if class_ids is not None:
+        keep &= np.isin(detected_ids, class_ids)
+
+    detections = detections[keep]
+    # Same truncation as int() on each value, so boxes match the per-row code
+    center_x = np.trunc(detections[:, 0] * width)
+    center_y = np.trunc(detections[:, 1] * height)
+    w = np.trunc(detections[:, 2] * width)
+    h = np.trunc(detections[:, 3] * height)
+    x = np.trunc(center_x - w / 2)
+    y = np.trunc(center_y - h / 2)
+
+    boxes = np.stack([x, y, w, h], axis=1).astype(np.int32)
+    return boxes, confidences[keep].astype(np.float32), detected_ids[keep]
+
+def nms(boxes, confidences, score_threshold, nms_threshold):
+    """
+    Non-maximum suppression over the arrays returned by postprocess.
+    :return: Flat int array of the indices of the kept boxes (empty if nothing is left).
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+    indices = cv2.dnn.NMSBoxes(boxes, confidences, score_threshold, nms_threshold)
+    return np.asarray(indices, dtype=np.intp).reshape(-1)
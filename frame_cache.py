@@ -0,0 +1,86 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+# Cache defaults
+CACHE_MAX_ENTRIES = 1024          # Maximum number of cached results
+CACHE_MAX_BYTES = 16 * 1024 * 1024  # Maximum total size of the cached results
+
+def payload_key(traffic_id, payload):
+    """
+    Hash a raw frame payload, as received and before any decoding, into a cache key.
+    The traffic_id is part of the key since results carry it.
+    """
+    digest = hashlib.blake2b(payload, digest_size=16, person=str(traffic_id).encode()[:16])
+    return digest.hexdigest()
+
+class FrameCache:
+    """
+    LRU cache from payload hashes to detection results, bounded by entry count and total bytes.
+    Results are stored as JSON, which gives their exact size and hands every caller its own copy.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> JSON bytes, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        :return: The cached result for key, or None.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(data)
+
+    def put(self, key, result):
+        data = json.dumps(result).encode()
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+class FrameCacheManager(BaseManager):
+    pass
+
+FrameCacheManager.register("FrameCache", FrameCache, exposed=("get", "put", "stats"))
+
+def start_shared_cache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+    """
+    Start a cache that can be shared between worker processes.
+    The cache lives in a manager process; the returned proxy has the same get/put/stats methods
+    as FrameCache and can be passed to other processes.
+    :return: Tuple (manager, cache). Call manager.shutdown() when done.
+    """
+    manager = FrameCacheManager()
+    manager.start()
+    return manager, manager.FrameCache(max_entries, max_bytes)
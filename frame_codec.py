@@ -0,0 +1,69 @@
+import json
+import time
+import base64
+import struct
+import numpy as np
+
+# Camera frame payloads accepted on traffic/light/imageN:
+# - Legacy JSON: {"image": "<base64 JPEG>"}
+# - Raw: the JPEG bytes themselves, metadata comes from the topic
+# - Raw with header: FRAME_MAGIC, then FRAME_HEADER (traffic_id, capture time in ms), then the JPEG bytes.
+#   The header's traffic_id must match the topic's, so a misconfigured camera can't feed another light
+FRAME_MAGIC = b"SRF1"
+FRAME_HEADER = struct.Struct("<IQ")
+JPEG_START = b"\xff\xd8"
+
+def encode_frame(jpeg_bytes, traffic_id=None, captured_at=None):
+    """
+    Build a raw frame payload for a camera to publish.
+    :param jpeg_bytes: Encoded JPEG image.
+    :param traffic_id: Optional traffic light id; when given, a compact header is added.
+    :param captured_at: Capture time in seconds since the epoch for the header, defaults to now.
+    """
+    if traffic_id is None:
+        return bytes(jpeg_bytes)
+    if captured_at is None:
+        captured_at = time.time()
+    return FRAME_MAGIC + FRAME_HEADER.pack(traffic_id, int(captured_at * 1000)) + bytes(jpeg_bytes)
+
+def split_header(payload, traffic_id=None):
+    """
+    Separate the header of a headered frame from its JPEG bytes, without decoding or copying anything.
+    :param traffic_id: Traffic light id of the topic the payload came on, checked against the header's.
+    :return: Tuple (body, header): a memoryview of the bytes after the header and a dict {"traffic_id", "captured_at"},
+             or (payload, None) for the formats without a header.
+    :raises ValueError: If the header is truncated or the header's traffic_id isn't the expected one.
+    """
+    if payload[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+        return payload, None
+    if len(payload) < len(FRAME_MAGIC) + FRAME_HEADER.size:
+        raise ValueError("Frame header is truncated.")
+    header_id, captured_ms = FRAME_HEADER.unpack_from(payload, len(FRAME_MAGIC))
+    if traffic_id is not None and header_id != traffic_id:
+        raise ValueError(f"Frame header is for traffic light {header_id}, not {traffic_id}.")
+    body = memoryview(payload)[len(FRAME_MAGIC) + FRAME_HEADER.size:]
+    return body, {"traffic_id": header_id, "captured_at": captured_ms / 1000}
+
+def decode_payload(payload, traffic_id=None):
+    """
+    Get the encoded image out of a frame payload in any of the accepted formats.
+    Raw payloads are wrapped without copying, ready for cv2.imdecode.
+    :param traffic_id: Traffic light id of the topic the payload came on, checked against the header's.
+    :return: Tuple (buffer, metadata) with buffer a uint8 array of the JPEG bytes and metadata a dict
+             ({"format", and "traffic_id"/"captured_at" for headered frames}).
+    :raises ValueError: If the payload is in none of the formats, its header is truncated,
+                        or the header's traffic_id isn't the expected one.
+    """
+    body, header = split_header(payload, traffic_id)
+    if header is not None:
+        return np.frombuffer(body, dtype=np.uint8), dict(header, format="header")
+
+    if payload[:len(JPEG_START)] == JPEG_START:
+        return np.frombuffer(payload, dtype=np.uint8), {"format": "raw"}
+
+    # Older cameras send base64 in JSON
+    try:
+        image_data = json.loads(payload)["image"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Payload is neither a raw JPEG frame nor a JSON frame with an image.")
+    return np.frombuffer(base64.b64decode(image_data), dtype=np.uint8), {"format": "json"}
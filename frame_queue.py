@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+class FrameQueue:
+    """
+    Bounded queue of pending camera frames that keeps only the newest frame per traffic_id.
+    A frame arriving while an older one from the same camera is still waiting replaces it,
+    so under load stale frames are dropped instead of piling up.
+    Frames of one camera are never handed to two workers at the same time, which keeps them in order.
+    """
+
+    def __init__(self, maxsize):
+        """
+        :param maxsize: Maximum number of cameras with a pending frame; the oldest is dropped beyond that.
+        """
+        self.maxsize = maxsize
+        self._pending = OrderedDict()  # traffic_id -> frame, oldest first
+        self._busy = set()  # traffic_ids currently being processed by a worker
+        self._condition = threading.Condition()
+        self.queued = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def put(self, traffic_id, frame):
+        """
+        Queue a frame, replacing any frame of the same camera that is still waiting.
+        """
+        with self._condition:
+            self.queued += 1
+            if traffic_id in self._pending:
+                # Keep the place in line but swap in the newer frame
+                self._pending[traffic_id] = frame
+                self.dropped += 1
+            else:
+                if len(self._pending) >= self.maxsize:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[traffic_id] = frame
+            self._condition.notify()
+
+    def _next_ready(self):
+        for traffic_id in self._pending:
+            if traffic_id not in self._busy:
+                return traffic_id
+        return None
+
+    def get(self, timeout=None):
+        """
+        Take the oldest pending frame whose camera is not already being processed.
+        :return: Tuple (traffic_id, frame), or None if nothing became ready within timeout.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._next_ready() is not None, timeout):
+                return None
+            traffic_id = self._next_ready()
+            frame = self._pending.pop(traffic_id)
+            self._busy.add(traffic_id)
+            return traffic_id, frame
+
+    def done(self, traffic_id):
+        """
+        Mark the frame taken for traffic_id as processed, allowing the camera's next frame to be taken.
+        """
+        with self._condition:
+            self._busy.discard(traffic_id)
+            self.processed += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "queued": self.queued,
+                "dropped": self.dropped,
+                "processed": self.processed,
+                "pending": len(self._pending)
+            }
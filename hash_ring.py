@@ -0,0 +1,44 @@
+import bisect
+import hashlib
+
+REPLICAS = 100  # Points per node on the ring, more spreads the keys more evenly
+
+def _hash(value):
+    # Stable across processes and machines, unlike hash()
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Consistent hash ring assigning keys (camera traffic_ids) to nodes (workers).
+    Every process building the ring from the same node names gets the same assignment, and adding
+    or removing a node only moves the keys of that node.
+    """
+
+    def __init__(self, nodes, replicas=REPLICAS):
+        self.nodes = list(nodes)
+        points = sorted((_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        """
+        Return the node owning a key.
+        """
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[i]
+
+def parse_camera_ids(text):
+    """
+    Parse a camera list like "1-200,305,410-420" into a sorted list of traffic_ids.
+    """
+    ids = set()
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        ids.update(range(int(first), int(last or first) + 1))
+    return sorted(ids)
+
+def worker_ring(count):
+    """
+    Ring of `count` car_det workers, named worker-0 ... worker-{count - 1}.
+    """
+    return HashRing([f"worker-{index}" for index in range(count)])
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from traffic_store import STORE_DIR, TrafficStore
+import timing_engine
+
+# Columnar history: one fixed-width binary file per column, all sorted by timestamp, read through memory maps.
+# Records with per-row counts (car_det) get one row per lane; records with only totals (cars_detection)
+# get a single row with row 0. Timestamps only have one-second resolution, so every row also carries
+# the sequence number of its record, which keeps the results of one second apart.
+HISTORY_DIR = "history"
+COLUMNS = {
+    "timestamp": "<i8",   # Seconds since the epoch
+    "record": "<i8",      # Sequence number of the record the row belongs to, in export order
+    "traffic_id": "<i4",
+    "row": "<i2",
+    "cars": "<i4",
+    "trucks": "<i4"
+}
+TIME_INDEX_SECONDS = 3600  # The time index holds the position of the first row of every hour
+WRITE_CHUNK_ROWS = 65536   # Rows buffered in memory while exporting
+REPLAY_CHUNK_ROWS = 1 << 20  # Rows replayed through the timing engine at a time
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # Format of the timestamps car_det stores
+
+def to_epoch(value):
+    """
+    Convert a record timestamp ('%Y-%m-%d %H:%M:%S' local time) or a number to seconds since the epoch.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return int(time.mktime(time.strptime(value, TIMESTAMP_FORMAT)))
+
+class HistoryWriter:
+    """
+    Write traffic records into the columnar format. Records can come in any order and any number;
+    only the current chunk is held in memory until close() sorts and indexes the columns.
+    """
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.rows = 0
+        self.records = 0
+        self._files = {name: open(self._path(name), "wb") for name in COLUMNS}
+        self._chunk = {name: [] for name in COLUMNS}
+        self._last_timestamp = (None, None)  # Consecutive records usually share their timestamp string
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _epoch(self, value):
+        if value != self._last_timestamp[0]:
+            self._last_timestamp = (value, to_epoch(value))
+        return self._last_timestamp[1]
+
+    def add(self, record, default_timestamp=0):
+        """
+        Add a traffic record: {"traffic_id", "rows": [{"row_id", "cars", "trucks"}, ...], "timestamp"}
+        or {"traffic_id", "cars", "trucks"}.
+        :param default_timestamp: Epoch seconds used when the record has no timestamp.
+        """
+        timestamp = self._epoch(record["timestamp"]) if "timestamp" in record else default_timestamp
+        rows = record.get("rows")
+        if rows is None:
+            rows = [{"row_id": 0, "cars": record.get("cars", 0), "trucks": record.get("trucks", 0)}]
+        chunk = self._chunk
+        for row in rows:
+            chunk["timestamp"].append(timestamp)
+            chunk["record"].append(self.records)
+            chunk["traffic_id"].append(record["traffic_id"])
+            chunk["row"].append(row["row_id"])
+            chunk["cars"].append(row["cars"])
+            chunk["trucks"].append(row["trucks"])
+        self.records += 1
+        if len(chunk["timestamp"]) >= WRITE_CHUNK_ROWS:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        self.rows += len(self._chunk["timestamp"])
+        for name, dtype in COLUMNS.items():
+            self._files[name].write(np.array(self._chunk[name], dtype=dtype).tobytes())
+            self._chunk[name] = []
+
+    def close(self):
+        """
+        Sort the columns by time, build the indexes and write meta.json.
+        """
+        self._write_chunk()
+        for file in self._files.values():
+            file.close()
+
+        timestamps = self._column("timestamp", "r")
+        if self.rows and np.any(timestamps[1:] < timestamps[:-1]):
+            self._sort(np.argsort(timestamps, kind="stable"))
+            timestamps = self._column("timestamp", "r")
+
+        # Positions grouped by traffic_id, in time order within each intersection
+        traffic_ids = self._column("traffic_id", "r")
+        by_traffic = np.argsort(traffic_ids, kind="stable").astype("<i8")
+        by_traffic.tofile(self._path("by_traffic"))
+        ids, starts, counts = np.unique(traffic_ids[by_traffic], return_index=True, return_counts=True)
+
+        # Row offsets of every TIME_INDEX_SECONDS period from the first to the last record
+        if self.rows:
+            first_period = int(timestamps[0]) // TIME_INDEX_SECONDS
+            periods = int(timestamps[-1]) // TIME_INDEX_SECONDS - first_period + 1
+            bounds = (first_period + np.arange(periods + 1, dtype=np.int64)) * TIME_INDEX_SECONDS
+            np.searchsorted(timestamps, bounds, side="left").astype("<i8").tofile(self._path("time_index"))
+        else:
+            first_period = 0
+            np.zeros(1, dtype="<i8").tofile(self._path("time_index"))
+
+        meta = {
+            "version": 2,
+            "rows": self.rows,
+            "records": self.records,
+            "columns": COLUMNS,
+            "start": int(timestamps[0]) if self.rows else None,
+            "end": int(timestamps[-1]) if self.rows else None,
+            "time_index_seconds": TIME_INDEX_SECONDS,
+            "time_index_start": first_period * TIME_INDEX_SECONDS,
+            "traffic_index": {str(traffic_id): [int(start), int(start + count)]
+                              for traffic_id, start, count in zip(ids.tolist(), starts.tolist(), counts.tolist())}
+        }
+        with open(os.path.join(self.directory, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=4)
+
+    def _column(self, name, mode):
+        if not self.rows:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._path(name), dtype=COLUMNS[name], mode=mode, shape=(self.rows,))
+
+    def _sort(self, order):
+        # Rewrite every column in time order, a chunk at a time
+        for name, dtype in COLUMNS.items():
+            source = self._column(name, "r")
+            temp_path = self._path(name) + ".tmp"
+            with open(temp_path, "wb") as file:
+                for start in range(0, self.rows, WRITE_CHUNK_ROWS):
+                    file.write(source[order[start:start + WRITE_CHUNK_ROWS]].astype(dtype).tobytes())
+            del source
+            os.replace(temp_path, self._path(name))
+
+class HistoryReader:
+    """
+    Memory-mapped access to a columnar history. Scans only touch the pages of the rows they return.
+    """
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as file:
+            self.meta = json.load(file)
+        self.rows = self.meta["rows"]
+        self.columns = {name: self._map(name, dtype) for name, dtype in self.meta["columns"].items()}
+        self._by_traffic = self._map("by_traffic", "<i8")
+        self._time_index = np.fromfile(os.path.join(directory, "time_index.bin"), dtype="<i8")
+
+    def _map(self, name, dtype):
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.directory, f"{name}.bin"), dtype=dtype, mode="r", shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def traffic_ids(self):
+        return sorted(int(traffic_id) for traffic_id in self.meta["traffic_index"])
+
+    def _position(self, timestamp):
+        # First row at or after a timestamp: the time index narrows it down to one period, then a binary search inside it
+        timestamp = to_epoch(timestamp)
+        period = int((timestamp - self.meta["time_index_start"]) // self.meta["time_index_seconds"])
+        if period < 0:
+            return 0
+        if period >= len(self._time_index) - 1:
+            return self.rows
+        low, high = int(self._time_index[period]), int(self._time_index[period + 1])
+        return low + int(np.searchsorted(self.columns["timestamp"][low:high], timestamp, side="left"))
+
+    def range(self, start=None, end=None):
+        """
+        Rows with start <= timestamp < end, as zero-copy views of the columns.
+        :param start: Epoch seconds or a '%Y-%m-%d %H:%M:%S' timestamp, None for the first row.
+        :param end: Same, None to read to the end.
+        :return: Dict {column: array}.
+        """
+        low = 0 if start is None else self._position(start)
+        high = self.rows if end is None else self._position(end)
+        return {name: column[low:high] for name, column in self.columns.items()}
+
+    def intersection(self, traffic_id, start=None, end=None):
+        """
+        Rows of one traffic light with start <= timestamp < end, in time order.
+        :return: Dict {column: array}, copied out of the memory maps.
+        """
+        low, high = self.meta["traffic_index"].get(str(traffic_id), (0, 0))
+        positions = self._by_traffic[low:high]
+        if start is not None or end is not None:
+            timestamps = self.columns["timestamp"][positions]
+            first = 0 if start is None else np.searchsorted(timestamps, to_epoch(start), side="left")
+            last = len(positions) if end is None else np.searchsorted(timestamps, to_epoch(end), side="left")
+            positions = positions[first:last]
+        return {name: column[positions] for name, column in self.columns.items()}
+
+    def replay(self, start=None, end=None, weather=timing_engine.DEFAULT_WEATHER,
+               car_threshold=None, truck_weight=None, chunk_rows=REPLAY_CHUNK_ROWS):
+        """
+        Recompute the traffic light times of every stored result (one per record)
+        with timing_engine, straight from the columns, a chunk of rows at a time.
+        :param weather: Weather of every intersection, or a dict {traffic_id: weather}.
+        :param car_threshold: Optional CAR_THRESHOLD to try instead of calculate's.
+        :param truck_weight: Optional TRUCK_WEIGHT to try instead of calculate's.
+        :return: Generator of dicts {"timestamp", "traffic_id", "time", "is_int"} of arrays, one per chunk.
+        """
+        columns = self.range(start, end)
+        timestamps = columns["timestamp"]
+        position = 0
+        while position < len(timestamps):
+            # Chunks end on a timestamp boundary, so no result is split between two chunks
+            stop = min(position + chunk_rows, len(timestamps))
+            if stop < len(timestamps):
+                # Back to the first row of the timestamp at the end, or past its last row if it fills the chunk
+                boundary = position + int(np.searchsorted(timestamps[position:stop], timestamps[stop], side="left"))
+                if boundary == position:
+                    boundary = stop + int(np.searchsorted(timestamps[stop:], timestamps[stop], side="right"))
+                stop = boundary
+            chunk = {name: np.asarray(column[position:stop]) for name, column in columns.items()}
+            yield self._replay_chunk(chunk, weather, car_threshold, truck_weight)
+            position = stop
+
+    def _replay_chunk(self, chunk, weather, car_threshold, truck_weight):
+        # Group the rows into results by record, keeping the stored row order inside each.
+        # Version 1 histories have no record column, their results are grouped by (timestamp, traffic_id)
+        key = chunk["record"] if "record" in chunk else chunk["traffic_id"]
+        order = np.lexsort((np.arange(len(chunk["timestamp"])), key, chunk["timestamp"]))
+        timestamps, traffic_ids, keys = chunk["timestamp"][order], chunk["traffic_id"][order], key[order]
+        starts = np.flatnonzero(np.r_[True, (timestamps[1:] != timestamps[:-1]) | (keys[1:] != keys[:-1])])
+        result_ids = traffic_ids[starts]
+
+        if isinstance(weather, dict):
+            names = {traffic_id: weather.get(traffic_id, timing_engine.DEFAULT_WEATHER) for traffic_id in np.unique(result_ids).tolist()}
+            factors = [timing_engine.weather_factor(names[traffic_id]) for traffic_id in result_ids.tolist()]
+        else:
+            factors = [timing_engine.weather_factor(weather)] * len(starts)
+
+        columns = {
+            "traffic_id": result_ids,
+            "weather_factor": np.array(factors, dtype=np.float64),
+            "factor_is_int": np.array([isinstance(factor, int) for factor in factors], dtype=bool),
+            "intersection": np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(order)])),
+            "row_id": chunk["row"][order].astype(np.int64),
+            "cars": chunk["cars"][order].astype(np.int64),
+            "trucks": chunk["trucks"][order].astype(np.int64)
+        }
+        times, is_int = timing_engine.allocate_time_columns(columns, car_threshold, truck_weight)
+        return {"timestamp": timestamps[starts], "traffic_id": result_ids, "time": times, "is_int": is_int}
+
+def export_history(records, directory=HISTORY_DIR, default_timestamp=0):
+    """
+    Write an iterable of traffic records to a fresh columnar history.
+    :return: Number of rows written.
+    """
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    writer = HistoryWriter(directory)
+    for record in records:
+        writer.add(record, default_timestamp)
+    writer.close()
+    return writer.rows
+
+def iter_store_records(store_dirs):
+    """
+    Yield the records of one or more traffic stores (e.g. the per-worker stores of launcher.py).
+    """
+    for store_dir in store_dirs:
+        store = TrafficStore(store_dir, flush_interval=0)
+        try:
+            yield from store.iter_records()
+        finally:
+            store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and analyse the columnar traffic history.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Write a columnar history from traffic stores or a JSON array file")
+    export.add_argument("--store", nargs="+", default=[STORE_DIR], help="Traffic store directories")
+    export.add_argument("--json", help="JSON array file to export instead (e.g. traffic_data.json or traffic_results.json)")
+    export.add_argument("--history", default=HISTORY_DIR, help="Output directory")
+
+    replay = subparsers.add_parser("replay", help="Recompute the light times over a period of the history")
+    replay.add_argument("--history", default=HISTORY_DIR, help="History directory")
+    replay.add_argument("--start", help="First timestamp ('%%Y-%%m-%%d %%H:%%M:%%S')")
+    replay.add_argument("--end", help="Timestamp to stop before")
+    replay.add_argument("--traffic-id", type=int, help="Only report this traffic light")
+    replay.add_argument("--weather", default=timing_engine.DEFAULT_WEATHER, help="Weather for every intersection")
+    replay.add_argument("--car-threshold", type=int, help="CAR_THRESHOLD to try")
+    replay.add_argument("--truck-weight", type=float, help="TRUCK_WEIGHT to try")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if args.json:
+            # Older files have no timestamps, their records get the file's modification time
+            with open(args.json, "r") as file:
+                records = json.load(file)
+            rows = export_history(records, args.history, int(os.path.getmtime(args.json)))
+        else:
+            rows = export_history(iter_store_records(args.store), args.history)
+        print(f"Exported {rows} rows to {args.history}")
+        return
+
+    reader = HistoryReader(args.history)
+    results = 0
+    total_time = 0.0
+    per_light = {}
+    for chunk in reader.replay(args.start, args.end, args.weather, args.car_threshold, args.truck_weight):
+        keep = chunk["traffic_id"] == args.traffic_id if args.traffic_id is not None else slice(None)
+        times, traffic_ids = chunk["time"][keep], chunk["traffic_id"][keep]
+        results += len(times)
+        total_time += float(times.sum())
+        ids, inverse = np.unique(traffic_ids, return_inverse=True)
+        light_totals = np.bincount(inverse, weights=times, minlength=len(ids))
+        light_counts = np.bincount(inverse, minlength=len(ids))
+        for traffic_id, light_total, light_count in zip(ids.tolist(), light_totals.tolist(), light_counts.tolist()):
+            entry = per_light.setdefault(traffic_id, [0.0, 0])
+            entry[0] += light_total
+            entry[1] += light_count
+    print(json.dumps({
+        "results": results,
+        "mean_time": round(total_time / results, 3) if results else None,
+        "mean_time_per_light": {traffic_id: round(light_total / count, 3) for traffic_id, (light_total, count) in sorted(per_light.items())}
+    }, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+import numpy as np
+import cv2
+
+# Default lanes: four horizontal bands splitting the frame height, in normalized coordinates (0-1).
+# Each lane is either a "band" (top, bottom) or a "polygon" [[x, y], ...].
+DEFAULT_LANES = [
+    {"row_id": 1, "band": (0.0, 0.25)},
+    {"row_id": 2, "band": (0.25, 0.5)},
+    {"row_id": 3, "band": (0.5, 0.75)},
+    {"row_id": 4, "band": (0.75, 1.0)}
+]
+
+# Optional per-camera lane definitions: {"<traffic_id>": [lane, ...]}, cameras not listed use DEFAULT_LANES
+LANES_FILE = "lanes.json"
+
+LABEL_MAP_SCALE = 4  # Polygon label maps are rasterized at 1/N of the frame resolution
+
+def load_lanes(path=LANES_FILE):
+    """
+    Load the per-camera lane definitions.
+    :return: Dict {traffic_id: lanes}, empty if the file doesn't exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return {int(traffic_id): lanes for traffic_id, lanes in json.load(file).items()}
+
+class LaneMap:
+    """
+    Lane definitions compiled for one frame resolution.
+    Bands become sorted breakpoints looked up with searchsorted, polygons a rasterized label map,
+    so assigning a whole frame of vehicles to rows is a single array lookup.
+    """
+
+    def __init__(self, lanes, width, height):
+        self.row_ids = [lane["row_id"] for lane in lanes]
+        self.width = width
+        self.height = height
+        self._breakpoints = None
+        self._band_rows = None
+        self._label_map = None
+
+        if all("band" in lane for lane in lanes):
+            self._compile_bands(lanes)
+        else:
+            self._compile_label_map(lanes)
+
+    def _compile_bands(self, lanes):
+        # Pixel edges of all bands; every interval between two edges maps to a lane index or -1 (no lane)
+        edges = sorted({int(round(edge * self.height)) for lane in lanes for edge in lane["band"]})
+        self._breakpoints = np.array(edges)
+        band_rows = np.full(len(edges) + 1, -1)
+        for interval in range(1, len(edges)):
+            top = edges[interval - 1]
+            for index, lane in enumerate(lanes):
+                lane_top, lane_bottom = (int(round(edge * self.height)) for edge in lane["band"])
+                if lane_top <= top < lane_bottom:
+                    band_rows[interval] = index
+                    break
+        self._band_rows = band_rows
+
+    def _compile_label_map(self, lanes):
+        map_height = -(-self.height // LABEL_MAP_SCALE)
+        map_width = -(-self.width // LABEL_MAP_SCALE)
+        label_map = np.full((map_height, map_width), -1, dtype=np.int16)
+        # Later lanes are drawn first, so the first matching lane wins where lanes overlap
+        for index in reversed(range(len(lanes))):
+            lane = lanes[index]
+            if "band" in lane:
+                top, bottom = (int(round(edge * map_height)) for edge in lane["band"])
+                label_map[top:bottom, :] = index
+            else:
+                points = np.array(lane["polygon"], dtype=np.float64) * (map_width, map_height)
+                cv2.fillPoly(label_map, [np.round(points).astype(np.int32)], index)
+        self._label_map = label_map
+
+    def assign(self, centers_x, centers_y):
+        """
+        Look up the lane index of every point, -1 for points outside all lanes.
+        """
+        centers_x = np.asarray(centers_x)
+        centers_y = np.asarray(centers_y)
+        if self._label_map is not None:
+            map_x = centers_x // LABEL_MAP_SCALE
+            map_y = centers_y // LABEL_MAP_SCALE
+            inside = (map_x >= 0) & (map_x < self._label_map.shape[1]) & (map_y >= 0) & (map_y < self._label_map.shape[0])
+            rows = np.full(len(centers_y), -1)
+            rows[inside] = self._label_map[map_y[inside], map_x[inside]]
+            return rows
+        return self._band_rows[np.searchsorted(self._breakpoints, centers_y, side="right")]
+
+    def count(self, boxes, labels):
+        """
+        Count cars and trucks per lane for a frame of [x, y, w, h] boxes, using the centre of each box.
+        :return: Tuple (cars, trucks), int arrays with one entry per lane.
+        """
+        lanes = len(self.row_ids)
+        if len(boxes) == 0:
+            return np.zeros(lanes, dtype=int), np.zeros(lanes, dtype=int)
+
+        boxes = np.asarray(boxes).reshape(-1, 4).astype(int)
+        rows = self.assign(boxes[:, 0] + boxes[:, 2] // 2, boxes[:, 1] + boxes[:, 3] // 2)
+        labels = np.asarray(labels)
+        kind = np.where(labels == "car", 0, np.where(np.isin(labels, ["bus", "truck"]), 1, -1))
+
+        counted = (rows >= 0) & (kind >= 0)
+        counts = np.bincount(rows[counted] * 2 + kind[counted], minlength=lanes * 2).reshape(lanes, 2)
+        return counts[:, 0], counts[:, 1]
+
+# Compiled lane maps, {(traffic_id, width, height): LaneMap}
+_lanes = None
+_lane_maps = {}
+_lock = threading.Lock()
+
+def get_lane_map(traffic_id, width, height):
+    """
+    Return the lane map of a camera for a frame resolution, compiling it on first use.
+    """
+    global _lanes
+    key = (traffic_id, width, height)
+    lane_map = _lane_maps.get(key)
+    if lane_map is None:
+        with _lock:
+            if _lanes is None:
+                _lanes = load_lanes()
+            lane_map = _lane_maps.get(key)
+            if lane_map is None:
+                lane_map = LaneMap(_lanes.get(traffic_id, DEFAULT_LANES), width, height)
+                _lane_maps[key] = lane_map
+    return lane_map
@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+from metrics import METRICS_PORT
+from traffic_store import STORE_DIR
+from hash_ring import parse_camera_ids, worker_ring
+
+RESTART_DELAY = 5  # Seconds before restarting a worker that exited
+
+def worker_command(index, count, args, car_det_args):
+    """
+    Command line of one car_det worker.
+    With hashing, worker `index` of `count` takes the cameras the ring assigns to it; with a share group
+    every worker joins the same group and the broker splits the frames.
+    Without --cameras a hashing worker subscribes to the traffic/light/+ wildcard, so the broker sends it
+    every camera's frames and it drops the ones it doesn't own: the fan-out grows with workers x cameras.
+    With --cameras each worker subscribes to its own cameras' topics only.
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "car_det.py"),
+               "--broker", args.broker, "--port", str(args.port),
+               "--store-dir", os.path.join(args.store_dir, f"worker-{index}"),
+               "--threads", str(args.threads)]
+    if args.cameras:
+        command += ["--cameras", ",".join(str(traffic_id) for traffic_id in args.cameras)]
+    if args.share_group:
+        command += ["--share-group", args.share_group]
+    else:
+        command += ["--worker-index", str(index), "--worker-count", str(count)]
+    if args.metrics:
+        command += ["--metrics", "--metrics-port", str(args.metrics_port + index)]
+    if args.live_port:
+        command += ["--live-port", str(args.live_port + index)]
+    return command + car_det_args
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run several car_det worker processes that split the cameras between them. "
+                    "Options not listed here are passed on to every car_det worker.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes on this node")
+    parser.add_argument("--first-index", type=int, default=0, help="Index of this node's first worker among all nodes' workers")
+    parser.add_argument("--total-workers", type=int, help="Workers over all nodes, defaults to --workers (a single node)")
+    parser.add_argument("--share-group", help="Use an MQTT shared subscription group instead of consistent hashing")
+    parser.add_argument("--cameras", type=parse_camera_ids, help="All camera ids like 1-200,305; each worker subscribes only to the ones it owns "
+                                          "(without it every worker receives every camera's frames)")
+    parser.add_argument("--broker", default="broker.emqx.io", help="MQTT broker host")
+    parser.add_argument("--port", type=int, default=1883, help="MQTT broker port")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="Parent directory of the workers' traffic stores")
+    parser.add_argument("--metrics", action="store_true", help="Enable the workers' metrics, on consecutive ports")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Metrics port of the first worker")
+    parser.add_argument("--live-port", type=int, default=0, help="Live traffic port of the first worker, 0 disables it")
+    parser.add_argument("--threads", type=int,
+                        help="Inference threads of each worker, defaults to the node's cores divided between its workers")
+    parser.add_argument("--no-restart", action="store_true", help="Don't restart workers that exit")
+    args, car_det_args = parser.parse_known_args()
+    # Without a limit every worker's models would each use all the cores
+    if args.threads is None:
+        args.threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    count = args.total_workers or args.workers
+    indexes = range(args.first_index, args.first_index + args.workers)
+    if indexes.stop > count:
+        parser.error("--first-index + --workers is larger than --total-workers")
+
+    if count > 1 and not args.share_group and not args.cameras:
+        print(f"Warning: without --cameras each of the {count} workers receives every camera's frames "
+              "and drops the ones it doesn't own, multiplying the broker's traffic by the number of workers")
+
+    if args.cameras and count > 1 and not args.share_group:
+        # car_det refuses to start without cameras, a worker the ring gives none of them would only be restarted
+        ring = worker_ring(count)
+        owners = {ring.node_for(traffic_id) for traffic_id in args.cameras}
+        idle = [index for index in indexes if f"worker-{index}" not in owners]
+        if idle:
+            print(f"Workers {idle} own none of the cameras and are not started")
+            indexes = [index for index in indexes if index not in idle]
+
+    processes = {}
+    stopping = False
+
+    def start(index):
+        command = worker_command(index, count, args, car_det_args)
+        print(f"Starting worker {index}: {' '.join(command)}")
+        processes[index] = subprocess.Popen(command)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in indexes:
+        start(index)
+
+    # Restart workers that exit, so their cameras are not left without one
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(processes.items()):
+            code = process.poll()
+            if code is None or stopping:
+                continue
+            print(f"Worker {index} exited with code {code}")
+            if args.no_restart:
+                del processes[index]
+            else:
+                time.sleep(RESTART_DELAY)
+                if not stopping:
+                    start(index)
+        if not processes:
+            break
+
+    for process in processes.values():
+        process.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import re
+import json
+import time
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from calculate import CAR_THRESHOLD, TRUCK_WEIGHT
+
+# Rolling windows reported for every intersection, in seconds (multiples of BUCKET_SECONDS)
+WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+BUCKET_SECONDS = 5  # Results are summed per time bucket; windows move one bucket at a time
+
+# Congestion by the effective vehicle count (cars + weighted trucks) of the busiest row,
+# CAR_THRESHOLD being where calculate.allocate_time_per_row starts treating a row as heavy
+CONGESTION_LEVELS = ((2 * CAR_THRESHOLD, "high"), (CAR_THRESHOLD, "moderate"), (0, "low"))
+
+LIVE_HOST = "127.0.0.1"  # The endpoint is local only
+LIVE_PORT = 8088
+LIVE_PATH = re.compile(r"^/api/live-traffic(?:/(\d+))?/?$")
+
+def congestion_level(cars, trucks):
+    """
+    Congestion level of an intersection from its per-row cars and trucks (counts or averages).
+    """
+    effective = np.asarray(cars) + np.asarray(trucks) * TRUCK_WEIGHT
+    busiest = float(effective.max()) if len(effective) else 0.0
+    for threshold, level in CONGESTION_LEVELS:
+        if busiest >= threshold:
+            return level
+    return "low"
+
+class _Camera:
+    """
+    Ring buffers of one intersection: per-bucket sums of the cars and trucks of each row, sample counts
+    and peaks, plus running sums and peaks of every window, updated as buckets enter and leave.
+    """
+
+    def __init__(self, row_ids, slots, windows):
+        rows = len(row_ids)
+        self.row_ids = row_ids
+        self.slots = slots
+        self.windows = windows  # name -> window length in buckets
+        self.cars = np.zeros((slots, rows), dtype=np.int64)
+        self.trucks = np.zeros((slots, rows), dtype=np.int64)
+        self.samples = np.zeros(slots, dtype=np.int64)
+        self.row_peaks = np.zeros((slots, rows), dtype=np.int64)
+        self.total_peaks = np.zeros(slots, dtype=np.int64)
+        self.bucket = None  # Absolute index of the newest bucket
+        self.sums = {name: [np.zeros(rows, dtype=np.int64), np.zeros(rows, dtype=np.int64), 0] for name in windows}
+        self.peaks = {name: [np.zeros(rows, dtype=np.int64), 0] for name in windows}
+        self.latest = None
+        self.updated_at = None
+
+    def advance(self, bucket):
+        """
+        Move the windows forward to a bucket, dropping the buckets that leave each window.
+        Costs one step per elapsed bucket (at most the ring size), so it is O(1) amortized.
+        """
+        if self.bucket is None:
+            self.bucket = bucket
+            return
+        if bucket <= self.bucket:
+            return
+
+        if bucket - self.bucket >= self.slots:
+            # Everything has left every window
+            for array in (self.cars, self.trucks, self.samples, self.row_peaks, self.total_peaks):
+                array[...] = 0
+            for sums in self.sums.values():
+                sums[0][:] = 0
+                sums[1][:] = 0
+                sums[2] = 0
+        else:
+            for newest in range(self.bucket + 1, bucket + 1):
+                for name, length in self.windows.items():
+                    leaving = (newest - length) % self.slots
+                    sums = self.sums[name]
+                    sums[0] -= self.cars[leaving]
+                    sums[1] -= self.trucks[leaving]
+                    sums[2] -= int(self.samples[leaving])
+                slot = newest % self.slots
+                for array in (self.cars, self.trucks, self.samples, self.row_peaks, self.total_peaks):
+                    array[slot] = 0
+        self.bucket = bucket
+
+        # Peaks can't be subtracted, recompute them over the buckets still in each window
+        for name, length in self.windows.items():
+            window = np.arange(bucket - length + 1, bucket + 1) % self.slots
+            self.peaks[name] = [self.row_peaks[window].max(axis=0), int(self.total_peaks[window].max())]
+
+    def add(self, cars, trucks):
+        slot = self.bucket % self.slots
+        total = int(cars.sum() + trucks.sum())
+        self.cars[slot] += cars
+        self.trucks[slot] += trucks
+        self.samples[slot] += 1
+        np.maximum(self.row_peaks[slot], cars + trucks, out=self.row_peaks[slot])
+        self.total_peaks[slot] = max(self.total_peaks[slot], total)
+        for name in self.windows:
+            sums = self.sums[name]
+            sums[0] += cars
+            sums[1] += trucks
+            sums[2] += 1
+            peaks = self.peaks[name]
+            np.maximum(peaks[0], cars + trucks, out=peaks[0])
+            peaks[1] = max(peaks[1], total)
+
+class LiveTraffic:
+    """
+    In-memory rolling aggregates of the detection results per traffic_id and row.
+    Every result updates the running sums and peaks of each window, so a query only reads them,
+    without touching the traffic store or the inference path.
+    """
+
+    def __init__(self, windows=WINDOWS, bucket_seconds=BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.windows = {name: max(1, int(seconds // bucket_seconds)) for name, seconds in windows.items()}
+        self.slots = max(self.windows.values())
+        self._cameras = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, now):
+        return int((time.time() if now is None else now) // self.bucket_seconds)
+
+    def add(self, traffic_entry, now=None):
+        """
+        Add a detection result ({"traffic_id", "rows": [{"row_id", "cars", "trucks"}, ...]}).
+        """
+        rows = traffic_entry["rows"]
+        row_ids = [row["row_id"] for row in rows]
+        cars = np.array([row["cars"] for row in rows], dtype=np.int64)
+        trucks = np.array([row["trucks"] for row in rows], dtype=np.int64)
+        traffic_id = traffic_entry["traffic_id"]
+
+        with self._lock:
+            camera = self._cameras.get(traffic_id)
+            if camera is None or camera.row_ids != row_ids:
+                # New intersection, or its lanes changed: start over
+                camera = self._cameras[traffic_id] = _Camera(row_ids, self.slots, self.windows)
+            camera.advance(self._bucket(now))
+            camera.add(cars, trucks)
+            camera.latest = (cars, trucks)
+            camera.updated_at = time.time() if now is None else now
+
+    def traffic_ids(self):
+        with self._lock:
+            return sorted(self._cameras)
+
+    def query(self, traffic_id, now=None):
+        """
+        Current counts and rolling aggregates of one intersection.
+        :return: Dict ready for JSON, or None for an unknown traffic_id.
+        """
+        with self._lock:
+            camera = self._cameras.get(traffic_id)
+            if camera is None:
+                return None
+            camera.advance(self._bucket(now))
+
+            cars, trucks = camera.latest
+            result = {
+                "traffic_id": traffic_id,
+                "updated_at": camera.updated_at,
+                "current": {
+                    "rows": [
+                        {"row_id": row_id, "cars": int(row_cars), "trucks": int(row_trucks)}
+                        for row_id, row_cars, row_trucks in zip(camera.row_ids, cars, trucks)
+                    ],
+                    "cars": int(cars.sum()),
+                    "trucks": int(trucks.sum()),
+                    "congestion_level": congestion_level(cars, trucks)
+                },
+                "windows": {}
+            }
+            for name in self.windows:
+                sum_cars, sum_trucks, samples = camera.sums[name]
+                row_peaks, total_peak = camera.peaks[name]
+                if samples == 0:
+                    result["windows"][name] = {"samples": 0}
+                    continue
+                avg_cars = sum_cars / samples
+                avg_trucks = sum_trucks / samples
+                result["windows"][name] = {
+                    "samples": samples,
+                    "rows": [
+                        {"row_id": row_id, "avg_cars": round(float(row_cars), 2),
+                         "avg_trucks": round(float(row_trucks), 2), "max_vehicles": int(peak)}
+                        for row_id, row_cars, row_trucks, peak in zip(camera.row_ids, avg_cars, avg_trucks, row_peaks)
+                    ],
+                    "avg_cars": round(float(avg_cars.sum()), 2),
+                    "avg_trucks": round(float(avg_trucks.sum()), 2),
+                    "max_vehicles": total_peak,
+                    "congestion_level": congestion_level(avg_cars, avg_trucks)
+                }
+            return result
+
+    def overview(self, now=None):
+        """
+        Query every intersection.
+        """
+        return [self.query(traffic_id, now) for traffic_id in self.traffic_ids()]
+
+# Aggregates of this process, fed by car_det with every published result
+live_traffic = LiveTraffic()
+
+def serve_live_traffic(live=live_traffic, port=LIVE_PORT, host=LIVE_HOST):
+    """
+    Serve the live aggregates over HTTP on a daemon thread: GET /api/live-traffic for every intersection,
+    GET /api/live-traffic/<traffic_id> for one.
+    :return: The server (call shutdown() to stop it).
+    """
+    class LiveTrafficHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = LIVE_PATH.match(self.path)
+            if not match:
+                self.send_error(404)
+                return
+            if match.group(1):
+                result = live.query(int(match.group(1)))
+                if result is None:
+                    self.send_error(404, "Unknown traffic_id")
+                    return
+            else:
+                result = live.overview()
+            body = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Dashboard polling would flood the service output
+
+    server = ThreadingHTTPServer((host, port), LiveTrafficHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,188 @@
+import json
+import time
+import bisect
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency histogram bucket upper bounds, in milliseconds (one more bucket catches everything above)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+METRICS_HOST = "127.0.0.1"  # The HTTP endpoint is local only
+METRICS_PORT = 9108
+STATS_TOPIC = "traffic/metrics"
+STATS_INTERVAL = 60  # Seconds between stats messages on STATS_TOPIC
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Observing is a binary search and two additions.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in (the max for the overflow bucket).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "max_ms": round(self.max, 3),
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts))
+        }
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "traffic_id", "start")
+
+    def __init__(self, metrics, stage, traffic_id):
+        self.metrics = metrics
+        self.stage = stage
+        self.traffic_id = traffic_id
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, self.traffic_id, time.perf_counter() - self.start)
+        return False
+
+# Handed out by Metrics.stage() while disabled, so a disabled stage costs one attribute check
+_DISABLED = contextlib.nullcontext()
+
+class Metrics:
+    """
+    Per-stage latency histograms, one per (stage, traffic_id).
+    Disabled by default; while disabled, stage() returns a shared no-op context manager and
+    nothing is recorded.
+    """
+
+    def __init__(self, enabled=False, buckets=LATENCY_BUCKETS_MS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}  # (stage, traffic_id) -> Histogram
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def stage(self, stage, traffic_id=None):
+        """
+        Time a block of code: `with metrics.stage("nms", traffic_id): ...`
+        """
+        if not self.enabled:
+            return _DISABLED
+        return _StageTimer(self, stage, traffic_id)
+
+    def observe(self, stage, traffic_id, seconds):
+        """
+        Record one duration in seconds.
+        """
+        if not self.enabled:
+            return
+        key = (stage, traffic_id)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds * 1000)
+
+    def snapshot(self):
+        """
+        Return the histograms as {"uptime", "stages": {stage: {traffic_id: histogram}}}, ready for JSON.
+        """
+        stages = {}
+        with self._lock:
+            for (stage, traffic_id), histogram in sorted(self._histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                stages.setdefault(stage, {})[str(traffic_id)] = histogram.snapshot()
+        return {"uptime": round(time.time() - self.started_at, 1), "stages": stages}
+
+    def prometheus(self):
+        """
+        Render the histograms in the Prometheus text format.
+        """
+        name = "saferoad_stage_latency_seconds"
+        lines = [f"# TYPE {name} histogram"]
+        with self._lock:
+            for (stage, traffic_id), histogram in sorted(self._histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                labels = f'stage="{stage}",traffic_id="{"" if traffic_id is None else traffic_id}"'
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + [None], histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound is None else repr(bound / 1000)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.total / 1000}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+# Metrics of this process, enabled by the services that expose them
+metrics = Metrics()
+
+def serve_metrics(registry=metrics, port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve the metrics over HTTP on a daemon thread: /metrics in the Prometheus text format,
+    /metrics.json as a JSON snapshot.
+    :return: The server (call shutdown() to stop it).
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = registry.prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would flood the service output
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_stats_publisher(client, registry=metrics, topic=STATS_TOPIC, interval=STATS_INTERVAL, extra=None):
+    """
+    Publish a JSON snapshot of the metrics on an MQTT topic every `interval` seconds, on a daemon thread.
+    :param extra: Optional callable returning a dict of other stats to include (e.g. queue counters).
+    :return: Event that stops the publisher when set.
+    """
+    stop = threading.Event()
+
+    def publish():
+        while not stop.wait(interval):
+            snapshot = registry.snapshot()
+            if extra is not None:
+                snapshot.update(extra())
+            client.publish(topic, json.dumps(snapshot))
+
+    threading.Thread(target=publish, daemon=True).start()
+    return stop
@@ -0,0 +1,131 @@
+import os
+import threading
+import numpy as np
+from detector import class_ids_for
+from backends import INPUT_SIZES, DNN_BACKENDS, DNN_TARGETS, OpenCVBackend, OnnxRuntimeBackend
+
+# YOLO model files (Assuming you have YOLOv4 model files)
+MODEL_WEIGHTS = 'yolov4.weights'
+MODEL_CONFIG = 'yolov4.cfg'
+CLASS_NAMES = 'coco.names'
+ONNX_MODEL = 'yolov4-int8.onnx'
+INPUT_SIZE = 416
+
+# Detector backend settings, changed with configure() before the first model is loaded
+_settings = {
+    "backend": "opencv",      # "opencv" or "onnxruntime"
+    "dnn_backend": "opencv",  # OpenCV DNN backend and target, see backends.DNN_BACKENDS / DNN_TARGETS
+    "dnn_target": "cpu",
+    "onnx_model": ONNX_MODEL,
+    "threads": None,          # Inference threads, None keeps the library default
+    "input_size": INPUT_SIZE  # Default network input size, one of backends.INPUT_SIZES
+}
+
+# Shared instances, loaded on first use
+_lock = threading.Lock()
+_model = None
+_model_pid = None
+_classes = None
+_class_ids = {}
+
+def configure(**settings):
+    """
+    Change the detector backend settings (see _settings). The shared model is reloaded on next use.
+    """
+    global _model
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Unknown model settings: {', '.join(sorted(unknown))}")
+    if settings.get("input_size", INPUT_SIZE) not in INPUT_SIZES:
+        raise ValueError(f"Input size must be one of {INPUT_SIZES}.")
+    with _lock:
+        _settings.update(settings)
+        _model = None
+
+def get_settings():
+    """
+    Return a copy of the detector backend settings, e.g. to pass them on to worker processes.
+    """
+    return dict(_settings)
+
+def get_input_size():
+    """
+    Return the configured default network input size.
+    """
+    return _settings["input_size"]
+
+def load_model():
+    """
+    Load a new instance of the YOLO detector on the configured backend.
+    Use get_model() instead unless the caller needs a detector of its own (e.g. one per worker thread).
+    :return: Backend with infer(images, input_size), see backends.py.
+    """
+    if _settings["backend"] == "onnxruntime":
+        return OnnxRuntimeBackend(_settings["onnx_model"], _settings["threads"])
+    if _settings["backend"] != "opencv":
+        raise ValueError(f"Unknown detector backend: {_settings['backend']}")
+    return OpenCVBackend(MODEL_WEIGHTS, MODEL_CONFIG, _settings["dnn_backend"], _settings["dnn_target"], _settings["threads"])
+
+def get_model():
+    """
+    Return the YOLO detector shared by the detection functions of this process, loading it on first use.
+    A forked child process loads its own instead of using the one copied from its parent.
+    :return: Backend with infer(images, input_size), see backends.py.
+    """
+    global _model, _model_pid
+    with _lock:
+        if _model is None or _model_pid != os.getpid():
+            _model = load_model()
+            _model_pid = os.getpid()
+        return _model
+
+def get_classes():
+    """
+    Return the class labels from coco.names, read on first use.
+    """
+    global _classes
+    with _lock:
+        if _classes is None:
+            with open(CLASS_NAMES, "r") as f:
+                _classes = [line.strip() for line in f.readlines()]
+        return _classes
+
+def get_class_ids(labels):
+    """
+    Return the class ids of the given labels (see detector.class_ids_for), computed once per label set.
+    """
+    labels = tuple(labels)
+    if labels not in _class_ids:
+        _class_ids[labels] = class_ids_for(get_classes(), labels)
+    return _class_ids[labels]
+
+def warm_up(model=None, input_sizes=None):
+    """
+    Load the model and run one forward pass on a blank image per input size, so the first real frame
+    doesn't pay for loading the weights and setting up the network's layers.
+    :param model: Optional detector from load_model(), defaults to the shared model.
+    :param input_sizes: Input sizes the model will run at, defaults to the configured one.
+    """
+    model = model or get_model()
+    for input_size in input_sizes or (get_input_size(),):
+        blank = np.zeros((input_size, input_size, 3), dtype=np.uint8)
+        model.infer([blank], input_size)
+
+def add_model_arguments(parser):
+    """
+    Add the detector backend options to a command line parser (apply them with configure_from_args).
+    """
+    parser.add_argument("--backend", choices=("opencv", "onnxruntime"), default=_settings["backend"], help="Detector backend")
+    parser.add_argument("--dnn-backend", choices=DNN_BACKENDS, default=_settings["dnn_backend"], help="OpenCV DNN backend")
+    parser.add_argument("--dnn-target", choices=DNN_TARGETS, default=_settings["dnn_target"], help="OpenCV DNN target")
+    parser.add_argument("--onnx-model", default=_settings["onnx_model"], help="ONNX model for the onnxruntime backend, e.g. an int8-quantized YOLOv4")
+    parser.add_argument("--input-size", type=int, choices=INPUT_SIZES, default=_settings["input_size"], help="Network input size")
+
+def configure_from_args(args):
+    configure(
+        backend=args.backend,
+        dnn_backend=args.dnn_backend,
+        dnn_target=args.dnn_target,
+        onnx_model=args.onnx_model,
+        input_size=args.input_size
+    )
@@ -0,0 +1,62 @@
+import copy
+import threading
+import cv2
+
+# Change detector defaults
+THUMBNAIL_SIZE = (64, 36)  # Width and height of the grayscale thumbnail compared between frames
+CHANGE_THRESHOLD = 4.0     # Mean absolute gray level difference (0-255) below which the scene counts as unchanged
+MAX_SKIPPED_FRAMES = 30    # Run the detector at least every N frames even if nothing seems to change
+
+class MotionGate:
+    """
+    Per-camera change detector that decides whether a frame needs a new YOLO pass.
+    Each frame is reduced to a small grayscale thumbnail and compared with the thumbnail of the last
+    frame that was actually inferred, so slow drift still adds up to a change eventually.
+    """
+
+    def __init__(self, threshold=CHANGE_THRESHOLD, max_skipped=MAX_SKIPPED_FRAMES, size=THUMBNAIL_SIZE):
+        """
+        :param threshold: Change score below which the previous result is reused, 0 disables the gate.
+        :param max_skipped: Maximum number of consecutive frames of a camera that reuse a result.
+        :param size: Thumbnail (width, height).
+        """
+        self.threshold = threshold
+        self.max_skipped = max_skipped
+        self.size = size
+        self._lock = threading.Lock()
+        self._cameras = {}  # traffic_id -> {"thumbnail", "result", "skipped", "pending"}
+
+    def _thumbnail(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    def check(self, traffic_id, image):
+        """
+        Compare a frame with the last inferred frame of its camera.
+        :return: Tuple (changed, score, previous_result). previous_result is a copy of the last result
+                 when the frame is unchanged, otherwise None and the caller should run detection and record() it.
+        """
+        thumbnail = self._thumbnail(image)
+        with self._lock:
+            camera = self._cameras.setdefault(traffic_id, {"thumbnail": None, "result": None, "skipped": 0})
+            camera["pending"] = thumbnail
+
+            if camera["thumbnail"] is None or camera["result"] is None:
+                return True, None, None
+
+            score = float(cv2.absdiff(thumbnail, camera["thumbnail"]).mean())
+            if score >= self.threshold or camera["skipped"] >= self.max_skipped:
+                return True, score, None
+
+            camera["skipped"] += 1
+            return False, score, copy.deepcopy(camera["result"])
+
+    def record(self, traffic_id, result):
+        """
+        Remember the detection result of the frame last passed to check() for this camera.
+        """
+        with self._lock:
+            camera = self._cameras[traffic_id]
+            camera["thumbnail"] = camera.pop("pending", None)
+            camera["result"] = copy.deepcopy(result)
+            camera["skipped"] = 0
@@ -0,0 +1,186 @@
+import json
+import time
+import threading
+from collections import deque
+import paho.mqtt.client as mqtt
+
+# Publishing defaults
+QOS = 1                  # Delivery acknowledged by the broker (PUBACK), 0 is fire and forget
+FLUSH_INTERVAL = 0.5     # Seconds between flushes of the coalesced messages
+MAX_BATCH = 500          # Items per batched payload, a full batch is sent right away
+MAX_PAYLOAD = 256 * 1024 # Bytes per batched payload, well below the usual broker packet limits
+MAX_BUFFERED = 1000      # Payloads kept while the broker is unreachable, the oldest are dropped beyond it
+RECONNECT_DELAY = (1, 30)  # Min and max seconds between reconnection attempts (paho backs off in between)
+
+def _encode(item):
+    return json.dumps(item, separators=(",", ":"))
+
+class MqttPublisher:
+    """
+    Coalescing, acknowledged publishing on top of a paho client.
+    publish() sends an item as a message of its own. add() appends items to the topic's next batch, sent as
+    one JSON list per flush interval or when the batch reaches max_batch items or max_payload bytes.
+    set() keeps only the latest item per topic until the next flush, for topics carrying a state. Payloads are
+    only handed to paho while connected; in between, batches wait in a bounded outbound buffer and go out in
+    order after the reconnection, while states stay coalesced so only each topic's latest is sent.
+    With QoS 1 or 2 a payload counts as delivered once the broker acknowledged it.
+    """
+
+    def __init__(self, client, qos=QOS, retain=False, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH,
+                 max_payload=MAX_PAYLOAD, max_buffered=MAX_BUFFERED):
+        """
+        :param client: paho client, its network loop runs elsewhere (loop_start() or loop_forever()).
+        :param retain: Publish with the retain flag, so new subscribers get the latest payload of every topic.
+        """
+        self.client = client
+        self.qos = qos
+        self.retain = retain
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_payload = max_payload
+        self.max_buffered = max_buffered
+
+        self.latest = {}  # topic -> last payload handed to the broker
+        self.sent = 0
+        self.acked = 0
+        self.dropped = 0
+        self._batches = {}  # topic -> [encoded items, payload size]
+        self._states = {}   # topic -> latest encoded item
+        self._outbound = deque()  # (topic, payload) waiting for a connection
+        self._pending = []        # MQTTMessageInfo of the payloads waiting for their acknowledgement
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()   # Keeps the outbound order when several threads flush
+        self._acked = threading.Condition()  # Notified by on_publish, never held while calling paho
+        self._stopped = threading.Event()
+
+        client.on_publish = self._on_publish
+        client.reconnect_delay_set(*RECONNECT_DELAY)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def publish(self, topic, item):
+        """
+        Send an item as its own message, for consumers that read one object per message.
+        """
+        encoded = _encode(item)
+        with self._lock:
+            self._buffer(topic, encoded)
+        self._send()
+
+    def add(self, topic, item):
+        """
+        Add an item to the topic's next batch.
+        """
+        encoded = _encode(item)
+        with self._lock:
+            batch = self._batches.setdefault(topic, [[], 2])
+            batch[0].append(encoded)
+            batch[1] += len(encoded) + 1
+            full = len(batch[0]) >= self.max_batch or batch[1] >= self.max_payload
+            if full:
+                self._buffer(topic, self._take_batch(topic))
+        if full:
+            self._send()
+
+    def set(self, topic, item):
+        """
+        Set the topic's state, replacing an item not flushed yet.
+        """
+        encoded = _encode(item)
+        with self._lock:
+            self._states[topic] = encoded
+
+    def flush(self):
+        """
+        Send every batch and state now. While disconnected the batches are buffered and the states kept
+        as they are, so a state set again before the reconnection replaces the old one.
+        """
+        connected = self.client.is_connected()
+        with self._lock:
+            for topic in list(self._batches):
+                self._buffer(topic, self._take_batch(topic))
+            if connected:
+                for topic, encoded in self._states.items():
+                    self._buffer(topic, encoded)
+                self._states.clear()
+        self._send()
+
+    def _take_batch(self, topic):
+        items, _ = self._batches.pop(topic)
+        return "[" + ",".join(items) + "]"
+
+    def _buffer(self, topic, payload):
+        # Called with the lock held
+        if len(self._outbound) >= self.max_buffered:
+            self._outbound.popleft()
+            self.dropped += 1
+        self._outbound.append((topic, payload))
+
+    def _send(self):
+        # Hand the buffered payloads to paho, in order, while connected
+        with self._send_lock:
+            while self.client.is_connected():
+                with self._lock:
+                    if not self._outbound:
+                        break
+                    topic, payload = self._outbound.popleft()
+                info = self.client.publish(topic, payload, self.qos, self.retain)
+                # Above QoS 0 paho keeps a message it couldn't write and resends it after reconnecting
+                if info.rc != mqtt.MQTT_ERR_SUCCESS and not (self.qos and info.rc == mqtt.MQTT_ERR_NO_CONN):
+                    with self._lock:
+                        self._outbound.appendleft((topic, payload))
+                    break
+                with self._lock:
+                    self._pending.append(info)
+                    self.latest[topic] = payload
+                    self.sent += 1
+
+    def _prune(self):
+        with self._lock:
+            pending = [info for info in self._pending if not info.is_published()]
+            self.acked += len(self._pending) - len(pending)
+            self._pending = pending
+            return not self._outbound and not self._states and not pending
+
+    def _on_publish(self, client, userdata, mid):
+        # Runs on paho's network thread once a payload is written (QoS 0) or acknowledged (QoS 1 and 2)
+        with self._acked:
+            self._acked.notify_all()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+                self._prune()
+            except Exception as e:
+                print(f"Error flushing MQTT messages: {e}")
+
+    def wait(self, timeout=None):
+        """
+        Flush, then wait until every payload is acknowledged.
+        :return: True if everything was delivered, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.flush()
+            if self._prune():
+                return True
+            remaining = self.flush_interval if deadline is None else min(self.flush_interval, deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            with self._acked:
+                self._acked.wait(remaining)
+
+    def stats(self):
+        with self._lock:
+            return {"sent": self.sent, "acked": self.acked, "dropped": self.dropped,
+                    "buffered": len(self._outbound), "states": len(self._states), "unacked": len(self._pending)}
+
+    def close(self, timeout=None):
+        """
+        Stop the flush thread after delivering what is left.
+        :return: True if everything was delivered.
+        """
+        self._stopped.set()
+        self._worker.join()
+        return self.wait(timeout)
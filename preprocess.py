@@ -0,0 +1,144 @@
+import os
+import json
+import threading
+import numpy as np
+import cv2
+from models import get_input_size
+
+# JPEG decode flags by reduction factor; libjpeg scales these down during decoding, which is much cheaper
+# than decoding at full resolution and letting blobFromImage resize
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR
+}
+
+# Optional per-camera regions of interest: {"<traffic_id>": [x0, y0, x1, y1]} in normalized coordinates (0-1)
+ROI_FILE = "rois.json"
+
+# Start-of-frame markers, which carry the image size (all SOFn except DHT, JPG and DAC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+class FrameTransform:
+    """
+    Maps coordinates from a reduced and/or cropped image back to the original camera frame.
+    """
+
+    def __init__(self, width, height, scale_x=1.0, scale_y=1.0, offset_x=0, offset_y=0):
+        """
+        :param width: Width of the original frame.
+        :param height: Height of the original frame.
+        """
+        self.width = width
+        self.height = height
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+
+    def to_original(self, boxes):
+        """
+        Map [x, y, w, h] boxes of the processed image to the original frame.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scale = np.array([self.scale_x, self.scale_y, self.scale_x, self.scale_y])
+        offset = np.array([self.offset_x, self.offset_y, 0, 0])
+        return np.round(boxes * scale + offset).astype(np.int32)
+
+def jpeg_size(buffer):
+    """
+    Read the size of a JPEG image from its header, without decoding it.
+    :param buffer: Encoded image bytes (bytes or uint8 array).
+    :return: Tuple (width, height), or None if the buffer isn't a JPEG or the header is cut off.
+    """
+    data = memoryview(buffer).cast("B")
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # Markers without a length
+            i += 2
+            continue
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+def choose_reduction(width, height, roi=None, input_size=None):
+    """
+    Pick the largest JPEG decode reduction that still leaves the network input at least its full resolution.
+    :param roi: Optional (x0, y0, x1, y1) normalized region the network will see.
+    :param input_size: Network input size, defaults to the configured one.
+    :return: Reduction factor, one of REDUCED_FLAGS.
+    """
+    input_size = input_size or get_input_size()
+    x0, y0, x1, y1 = roi or (0, 0, 1, 1)
+    region_width = width * (x1 - x0)
+    region_height = height * (y1 - y0)
+    for factor in sorted(REDUCED_FLAGS, reverse=True):
+        if region_width / factor >= input_size and region_height / factor >= input_size:
+            return factor
+    return 1
+
+_rois = None
+_rois_lock = threading.Lock()
+
+def get_roi(traffic_id):
+    """
+    Return the configured region of interest of a camera, or None to use the whole frame.
+    """
+    global _rois
+    if _rois is None:
+        with _rois_lock:
+            if _rois is None:
+                rois = {}
+                if os.path.exists(ROI_FILE):
+                    with open(ROI_FILE, "r") as file:
+                        rois = {int(traffic_id): tuple(roi) for traffic_id, roi in json.load(file).items()}
+                _rois = rois
+    return _rois.get(traffic_id)
+
+def decode_frame(buffer, traffic_id=None, input_size=None):
+    """
+    Decode a camera frame at the smallest useful scale and crop it to the camera's region of interest.
+    :param buffer: Encoded image as a uint8 array.
+    :param traffic_id: Camera id used to look up the region of interest, None for the whole frame.
+    :param input_size: Network input size the image is meant for, defaults to the configured one.
+    :return: Tuple (image, transform), or (None, None) if the buffer can't be decoded. The transform maps
+             boxes found on the image back to the original frame.
+    """
+    roi = get_roi(traffic_id) if traffic_id is not None else None
+    size = jpeg_size(buffer)
+    factor = choose_reduction(size[0], size[1], roi, input_size) if size else 1
+
+    image = cv2.imdecode(buffer, REDUCED_FLAGS[factor])
+    if image is None:
+        return None, None
+
+    decoded_height, decoded_width = image.shape[:2]
+    width, height = size if size else (decoded_width, decoded_height)
+    scale_x = width / decoded_width
+    scale_y = height / decoded_height
+
+    x0 = y0 = 0
+    if roi:
+        x0, y0 = int(roi[0] * decoded_width), int(roi[1] * decoded_height)
+        x1, y1 = int(np.ceil(roi[2] * decoded_width)), int(np.ceil(roi[3] * decoded_height))
+        image = image[y0:y1, x0:x1]
+
+    return image, FrameTransform(width, height, scale_x, scale_y, x0 * scale_x, y0 * scale_y)
+
+def read_frame(path, traffic_id=None, input_size=None):
+    """
+    decode_frame for an image file.
+    """
+    return decode_frame(np.fromfile(path, dtype=np.uint8), traffic_id, input_size)
@@ -0,0 +1,149 @@
+import re
+import json
+import time
+import argparse
+import threading
+import paho.mqtt.client as mqtt
+from calculate import MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, TIMINGS_TOPIC
+import timing_engine
+from mqtt_publisher import QOS, FLUSH_INTERVAL, MqttPublisher
+
+# car_det publishes counts on traffic/vehicle_count{id}, which a "+" wildcard can only match as a whole level
+COUNT_TOPIC_FILTER = "traffic/+"
+COUNT_TOPIC_PATTERN = re.compile(r"^traffic/vehicle_count(\d+)$")
+BATCH_COUNT_TOPIC = "traffic/vehicle_counts"  # car_det --batch-counts: JSON lists of counts of many intersections
+DEBOUNCE_SECONDS = 0.5  # Wait this long after a new count before recomputing, to absorb bursts
+
+class TimingController:
+    """
+    Long-running timing controller that keeps the latest vehicle counts per intersection in memory.
+    A new count only recomputes the timing of its own intersection, and only timings that changed
+    are published. Counts arriving within the debounce window of the first one are coalesced.
+    """
+
+    def __init__(self, publisher, debounce=DEBOUNCE_SECONDS, weather=timing_engine.DEFAULT_WEATHER, batch=False):
+        """
+        :param publisher: MqttPublisher the timings are sent through.
+        :param batch: Coalesce the timings into JSON lists on TIMINGS_TOPIC instead of one message each on MQTT_TOPIC.
+        :param debounce: Seconds to wait after a count before recomputing its intersection.
+        :param weather: Weather for every intersection, or a dict {traffic_id: weather}.
+        """
+        self.publisher = publisher
+        self.batch = batch
+        self.debounce = debounce
+        self.weather = weather
+        self.latest = {}   # traffic_id -> latest traffic entry
+        self.timings = {}  # traffic_id -> last published time
+        self._due = {}     # traffic_id -> monotonic time at which to recompute
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def on_count(self, traffic_id, traffic_entry):
+        """
+        Record a new count for an intersection and schedule its recomputation.
+        :raises ValueError, KeyError, TypeError: If the entry has no list of rows with integer
+                                                 row_id, cars and trucks; nothing is recorded then.
+        """
+        rows = [{"row_id": int(row["row_id"]), "cars": int(row["cars"]), "trucks": int(row["trucks"])}
+                for row in traffic_entry["rows"]]
+        traffic_entry = dict(traffic_entry, rows=rows)
+        with self._condition:
+            self.latest[traffic_id] = traffic_entry
+            if traffic_id not in self._due:
+                self._due[traffic_id] = time.monotonic() + self.debounce
+                self._condition.notify()
+
+    def on_message(self, client, userdata, msg):
+        match = COUNT_TOPIC_PATTERN.match(msg.topic)
+        if not match and msg.topic != BATCH_COUNT_TOPIC:
+            return
+        try:
+            traffic_entry = json.loads(msg.payload)
+        except ValueError:
+            print(f"Count on {msg.topic} could not be decoded as JSON.")
+            return
+        # Runs on paho's network thread, where an exception would stop the controller's loop
+        if match:
+            entries = [dict(traffic_entry, traffic_id=int(match.group(1)))] if isinstance(traffic_entry, dict) else []
+        else:
+            entries = traffic_entry if isinstance(traffic_entry, list) else []
+        if not entries:
+            print(f"Count on {msg.topic} skipped: expected {'a JSON object' if match else 'a JSON list of objects'}.")
+        for entry in entries:
+            try:
+                self.on_count(int(entry["traffic_id"]), entry)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Count on {msg.topic} skipped: {e!r}")
+
+    def _take_due(self):
+        # Wait until at least one intersection is due, then return the due entries
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [traffic_id for traffic_id, at in self._due.items() if at <= now]
+                if due:
+                    for traffic_id in due:
+                        del self._due[traffic_id]
+                    return {traffic_id: self.latest[traffic_id] for traffic_id in due}
+                timeout = min(self._due.values()) - now if self._due else None
+                self._condition.wait(timeout)
+
+    def _run(self):
+        while True:
+            entries = self._take_due()
+            try:
+                self.recompute(entries)
+            except Exception as e:
+                print(f"Error recomputing timings: {e}")
+
+    def recompute(self, entries):
+        """
+        Recompute the timings of the given intersections and publish the ones that changed.
+        :param entries: Dict {traffic_id: latest traffic entry}.
+        """
+        traffic_data = [dict(entry, traffic_id=traffic_id) for traffic_id, entry in entries.items()]
+        try:
+            timings = timing_engine.allocate_time(traffic_data, self.weather)
+        except Exception as e:
+            # One intersection's data shouldn't cost all the others their timings: retry them one by one
+            print(f"Error recomputing {len(traffic_data)} timings together, retrying one by one: {e}")
+            timings = []
+            for traffic in traffic_data:
+                try:
+                    timings += timing_engine.allocate_time([traffic], self.weather)
+                except Exception as e:
+                    print(f"Error recomputing the timing of traffic light {traffic['traffic_id']}: {e}")
+        for timing in timings:
+            if self.timings.get(timing["traffic_id"]) == timing["time"]:
+                continue
+            self.timings[timing["traffic_id"]] = timing["time"]
+            if self.batch:
+                self.publisher.add(TIMINGS_TOPIC, timing)
+            else:
+                self.publisher.publish(MQTT_TOPIC, timing)
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish traffic light timings as new vehicle counts arrive.")
+    parser.add_argument("--broker", default=MQTT_BROKER, help="MQTT broker host")
+    parser.add_argument("--port", type=int, default=MQTT_PORT, help="MQTT broker port")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="Seconds to coalesce counts per intersection")
+    parser.add_argument("--weather", default=timing_engine.DEFAULT_WEATHER, help="Weather for every intersection")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=QOS, help="QoS of the published timings")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="Seconds over which changed timings are coalesced into one message (with --batch-timings)")
+    parser.add_argument("--batch-timings", action="store_true",
+                        help=f"Publish the timings as JSON lists on {TIMINGS_TOPIC} instead of one message each on {MQTT_TOPIC}")
+    args = parser.parse_args()
+
+    client = mqtt.Client()
+    publisher = MqttPublisher(client, args.qos, flush_interval=args.flush_interval)
+    controller = TimingController(publisher, args.debounce, args.weather, args.batch_timings)
+    client.on_message = controller.on_message
+    # Subscribe on every (re)connect, so the subscription survives broker restarts
+    client.on_connect = lambda client, userdata, flags, rc: client.subscribe(COUNT_TOPIC_FILTER)
+    client.connect(args.broker, args.port, 60)
+    client.loop_forever()
+
+if __name__ == "__main__":
+    main()
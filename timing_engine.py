@@ -0,0 +1,156 @@
+import json
+import random
+import argparse
+import numpy as np
+from calculate import MIN_TIME, MAX_TIME, CAR_THRESHOLD, TRUCK_WEIGHT, MAX_TRAFFIC_TIME, allocate_time_per_row, load_traffic_data
+
+# Weather factors of calculate.allocate_time_per_row. The snowy factor is an int there, which
+# keeps below-threshold row times ints, so the types are tracked along with the values.
+WEATHER_FACTORS = {"rainy": 1.5, "snowy": 2, "foggy": 1.5}
+DEFAULT_WEATHER = "foggy"  # The weather calculate.allocate_time uses for every row
+
+def weather_factor(weather):
+    return WEATHER_FACTORS.get(weather, 1.0)
+
+def to_columns(traffic_data, weather=DEFAULT_WEATHER):
+    """
+    Load traffic entries into columnar arrays.
+    :param traffic_data: List of {"traffic_id", "rows": [{"row_id", "cars", "trucks"}, ...]} entries.
+    :param weather: Weather of every intersection, or a dict {traffic_id: weather} (missing ids use DEFAULT_WEATHER).
+    :return: Dict of arrays. Per intersection: traffic_id, weather_factor, factor_is_int.
+             Per row: intersection (index into the per-intersection arrays), row_id, cars, trucks.
+    """
+    row_counts = [len(traffic["rows"]) for traffic in traffic_data]
+    rows = [row for traffic in traffic_data for row in traffic["rows"]]
+    if isinstance(weather, dict):
+        weathers = [weather.get(traffic["traffic_id"], DEFAULT_WEATHER) for traffic in traffic_data]
+    else:
+        weathers = [weather] * len(traffic_data)
+    factors = [weather_factor(name) for name in weathers]
+
+    return {
+        "traffic_id": np.array([traffic["traffic_id"] for traffic in traffic_data]),
+        "weather_factor": np.array(factors, dtype=np.float64),
+        "factor_is_int": np.array([isinstance(factor, int) for factor in factors], dtype=bool),
+        "intersection": np.repeat(np.arange(len(traffic_data)), row_counts),
+        "row_id": np.array([row["row_id"] for row in rows], dtype=np.int64),
+        "cars": np.array([row["cars"] for row in rows], dtype=np.int64),
+        "trucks": np.array([row["trucks"] for row in rows], dtype=np.int64)
+    }
+
+def allocate_time_columns(columns, car_threshold=None, truck_weight=None):
+    """
+    Vectorized calculate.allocate_time over columnar data.
+    Applies the same rules in the same floating point order as allocate_time_per_row, then sums the
+    row times per intersection and applies MAX_TRAFFIC_TIME.
+    :param car_threshold: Optional CAR_THRESHOLD to use instead of calculate's (e.g. when re-tuning on history).
+    :param truck_weight: Optional TRUCK_WEIGHT to use instead of calculate's.
+    :return: Tuple (times, is_int): float64 time per intersection, and whether the scalar code would return an int.
+    """
+    car_threshold = CAR_THRESHOLD if car_threshold is None else car_threshold
+    truck_weight = TRUCK_WEIGHT if truck_weight is None else truck_weight
+    intersection = columns["intersection"]
+    factor = columns["weather_factor"][intersection]
+    factor_is_int = columns["factor_is_int"][intersection]
+
+    effective = columns["cars"] + np.trunc(columns["trucks"] * truck_weight).astype(np.int64)
+
+    # Proportional time with 1.5 seconds per vehicle, capped at MAX_TIME (min() keeps the int cap only when it is smaller)
+    proportional = MIN_TIME + (effective - 1) * 1.5 * factor
+    capped = proportional > MAX_TIME
+
+    heavy = effective >= car_threshold
+    empty = effective <= 0
+    row_time = np.where(empty, MIN_TIME, np.where(heavy, np.where(capped, MAX_TIME, proportional), MIN_TIME * factor))
+    row_is_int = empty | (heavy & capped) | (~heavy & factor_is_int)
+
+    # Grouped sums in row order, like the per-intersection loop
+    count = len(columns["traffic_id"])
+    totals = np.bincount(intersection, weights=row_time, minlength=count)
+    float_rows = np.bincount(intersection, weights=~row_is_int, minlength=count)
+
+    # Apply the max time for each traffic light, not per row
+    over = totals > MAX_TRAFFIC_TIME
+    times = np.where(over, MAX_TRAFFIC_TIME, totals)
+    is_int = over | (float_rows == 0)
+    return times, is_int
+
+def allocate_time(traffic_data, weather=DEFAULT_WEATHER):
+    """
+    Drop-in replacement for calculate.allocate_time, computed in one vectorized pass.
+    :return: List of {"traffic_id", "time"} dicts, equal in values and types to the scalar results.
+    """
+    columns = to_columns(traffic_data, weather)
+    times, is_int = allocate_time_columns(columns)
+    return [
+        {"traffic_id": traffic_id, "time": int(time) if time_is_int else float(time)}
+        for traffic_id, time, time_is_int in zip(columns["traffic_id"].tolist(), times.tolist(), is_int.tolist())
+    ]
+
+def scalar_allocate_time(traffic_data, weather=DEFAULT_WEATHER):
+    """
+    Reference results from calculate.allocate_time_per_row, looping like calculate.allocate_time
+    but with the same weather argument as allocate_time.
+    """
+    timings = []
+    for traffic in traffic_data:
+        name = weather.get(traffic["traffic_id"], DEFAULT_WEATHER) if isinstance(weather, dict) else weather
+        total_time = 0
+        for row in traffic["rows"]:
+            total_time += allocate_time_per_row(row["cars"], row["trucks"], name)
+        timings.append({"traffic_id": traffic["traffic_id"], "time": min(total_time, MAX_TRAFFIC_TIME)})
+    return timings
+
+def check_equivalence(traffic_data, weather=DEFAULT_WEATHER):
+    """
+    Compare the vectorized and scalar results, including int/float types (as they would be serialized).
+    :return: True if they are identical.
+    """
+    return json.dumps(allocate_time(traffic_data, weather)) == json.dumps(scalar_allocate_time(traffic_data, weather))
+
+def random_traffic_data(intersections, seed=0, max_rows=6, max_vehicles=12):
+    """
+    Synthetic traffic entries covering empty, light and heavy rows.
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "traffic_id": traffic_id,
+            "rows": [
+                {"row_id": row_id, "cars": rng.randint(0, max_vehicles), "trucks": rng.randint(0, max_vehicles // 3)}
+                for row_id in range(1, rng.randint(0, max_rows) + 1)
+            ]
+        }
+        for traffic_id in range(1, intersections + 1)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized traffic light timing allocation.")
+    parser.add_argument("--input", default="traffic_data.json", help="JSON file with the traffic entries")
+    parser.add_argument("--weather", default=DEFAULT_WEATHER, help="Weather for every intersection")
+    parser.add_argument("--check", action="store_true",
+                        help="Check the results against the scalar code on the input and on random data for every weather")
+    args = parser.parse_args()
+
+    traffic_data = load_traffic_data(args.input)
+    if not args.check:
+        print(json.dumps(allocate_time(traffic_data, args.weather), indent=4))
+        return
+
+    cases = [(args.input, traffic_data, args.weather)]
+    synthetic = random_traffic_data(2000)
+    for name in list(WEATHER_FACTORS) + ["sunny"]:
+        cases.append((f"random data, {name}", synthetic, name))
+    mixed = {traffic["traffic_id"]: random.Random(traffic["traffic_id"]).choice(list(WEATHER_FACTORS) + ["sunny"]) for traffic in synthetic}
+    cases.append(("random data, mixed weather", synthetic, mixed))
+
+    failed = False
+    for name, data, weather in cases:
+        ok = check_equivalence(data, weather)
+        failed |= not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import numpy as np
+from calculate import STOP_LINE_DISTANCE
+
+# Tracker defaults
+IOU_THRESHOLD = 0.3      # Minimum overlap for a detection to continue a track
+CENTROID_DISTANCE = 0.5  # ... or maximum centroid distance, relative to the track's box diagonal
+MAX_MISSED = 2           # Detection frames a track survives without a matching detection
+VELOCITY_SMOOTHING = 0.5 # Weight of the newest motion in the per-track velocity estimate
+MAX_SPEED = 0.25         # Maximum velocity in pixels per frame, relative to the track's box diagonal
+MISSED_VELOCITY_DECAY = 0.5  # Velocity kept by a track for every detection frame it isn't matched on
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Pairwise intersection over union of two sets of [x, y, w, h] boxes.
+    :return: (len(boxes_a), len(boxes_b)) float array.
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(1, -1, 4)
+    inter_w = np.clip(np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = inter_w * inter_h
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0)
+
+class Track:
+    """
+    A vehicle followed across frames.
+    """
+
+    def __init__(self, track_id, box, label):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.label = label
+        self.velocity = np.zeros(2, dtype=np.float32)  # Centroid motion in pixels per frame
+        self.last_center = self.center  # Centre at the last matching detection
+        self.frames_since_update = 0
+        self.missed = 0
+        self.side = None  # Side of the stop line the vehicle was last seen clearly on (-1 before, 1 after)
+        self.crossed = False
+
+    @property
+    def center(self):
+        return self.box[:2] + self.box[2:] / 2
+
+class VehicleTracker:
+    """
+    Lightweight IoU/centroid tracker keeping vehicle identities between frames.
+    Call update() with detections on frames that went through YOLO and predict() on the frames
+    in between, which moves every track along its estimated velocity without running the detector.
+    When a stop line is given, each vehicle is counted once when its centre crosses it. Crossings are only
+    evaluated on matched detections, never on predicted positions, so a vehicle stopping short of the line
+    isn't counted because its extrapolated box went past it.
+    """
+
+    def __init__(self, stop_line_y=None, crossing_margin=STOP_LINE_DISTANCE, iou_threshold=IOU_THRESHOLD,
+                 centroid_distance=CENTROID_DISTANCE, max_missed=MAX_MISSED):
+        """
+        :param stop_line_y: Pixel height of the stop line, None disables crossing events.
+        :param crossing_margin: Distance in pixels a centre must be past the line to count as being on that side.
+        """
+        self.stop_line_y = stop_line_y
+        self.crossing_margin = crossing_margin
+        self.iou_threshold = iou_threshold
+        self.centroid_distance = centroid_distance
+        self.max_missed = max_missed
+        self.tracks = []
+        self.crossings = 0
+        self._next_id = 1
+
+    def _match(self, boxes):
+        """
+        Greedily pair tracks and detections, first by overlap, then by centroid distance.
+        :return: List of (track_index, detection_index) pairs.
+        """
+        if not self.tracks or len(boxes) == 0:
+            return []
+
+        track_boxes = np.stack([track.box for track in self.tracks])
+        detections = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        overlap = iou_matrix(track_boxes, detections)
+
+        track_centers = track_boxes[:, :2] + track_boxes[:, 2:] / 2
+        detection_centers = detections[:, :2] + detections[:, 2:] / 2
+        distance = np.linalg.norm(track_centers[:, None, :] - detection_centers[None, :, :], axis=2)
+        max_distance = self.centroid_distance * np.linalg.norm(track_boxes[:, 2:], axis=1)[:, None]
+
+        pairs = []
+        used_tracks, used_detections = set(), set()
+
+        def take(track_indices, detection_indices):
+            for track_index, detection_index in zip(track_indices, detection_indices):
+                if track_index in used_tracks or detection_index in used_detections:
+                    continue
+                pairs.append((int(track_index), int(detection_index)))
+                used_tracks.add(track_index)
+                used_detections.add(detection_index)
+
+        # Best overlaps first, then the closest centroids for whatever is left
+        track_indices, detection_indices = np.nonzero(overlap >= self.iou_threshold)
+        order = np.argsort(-overlap[track_indices, detection_indices], kind="stable")
+        take(track_indices[order], detection_indices[order])
+
+        track_indices, detection_indices = np.nonzero(distance <= max_distance)
+        order = np.argsort(distance[track_indices, detection_indices], kind="stable")
+        take(track_indices[order], detection_indices[order])
+        return pairs
+
+    def _check_crossing(self, track):
+        if self.stop_line_y is None or track.crossed:
+            return
+        offset = track.center[1] - self.stop_line_y
+        if abs(offset) <= self.crossing_margin:
+            return
+        side = 1 if offset > 0 else -1
+        if track.side is not None and side != track.side:
+            track.crossed = True
+            self.crossings += 1
+        track.side = side
+
+    def _advance(self):
+        # Move every track one frame along its velocity
+        for track in self.tracks:
+            track.box[:2] += track.velocity
+            track.frames_since_update += 1
+
+    def update(self, boxes, labels):
+        """
+        Feed the detections of a frame that went through YOLO.
+        :param boxes: (N, 4) array of [x, y, w, h] boxes.
+        :param labels: N class labels.
+        :return: The current list of tracks.
+        """
+        self._advance()
+        pairs = self._match(boxes)
+        matched_tracks = {track_index for track_index, _ in pairs}
+        matched_detections = {detection_index for _, detection_index in pairs}
+
+        for track_index, detection_index in pairs:
+            track = self.tracks[track_index]
+            track.box = np.asarray(boxes[detection_index], dtype=np.float32)
+            # Average motion per frame since the last detection, smoothed over detections
+            step = (track.center - track.last_center) / track.frames_since_update
+            velocity = VELOCITY_SMOOTHING * step + (1 - VELOCITY_SMOOTHING) * track.velocity
+            max_speed = MAX_SPEED * float(np.linalg.norm(track.box[2:]))
+            speed = float(np.linalg.norm(velocity))
+            track.velocity = velocity * (max_speed / speed) if speed > max_speed else velocity
+            track.last_center = track.center
+            track.label = labels[detection_index]
+            track.frames_since_update = 0
+            track.missed = 0
+
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                # Unmatched tracks slow down, so a lost vehicle doesn't keep drifting at its last speed
+                track.missed += 1
+                track.velocity *= MISSED_VELOCITY_DECAY
+
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for detection_index in range(len(boxes)):
+            if detection_index not in matched_detections:
+                self.tracks.append(Track(self._next_id, boxes[detection_index], labels[detection_index]))
+                self._next_id += 1
+
+        # Only observed positions (matched or new tracks) count towards crossings
+        for track in self.tracks:
+            if track.frames_since_update == 0:
+                self._check_crossing(track)
+        return self.tracks
+
+    def predict(self):
+        """
+        Propagate the tracks to a frame that is not run through YOLO. Predicted positions don't count towards crossings.
+        :return: The current list of tracks.
+        """
+        self._advance()
+        return self.tracks
+
+    def boxes(self):
+        """
+        Current track boxes as an (N, 4) int array and their labels, in the format of the detectors.
+        """
+        if not self.tracks:
+            return np.empty((0, 4), dtype=np.int32), []
+        return np.stack([track.box for track in self.tracks]).astype(np.int32), [track.label for track in self.tracks]
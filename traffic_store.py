@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import bisect
+import argparse
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Store defaults
+STORE_DIR = "traffic_data"             # Directory holding the segment files
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024   # Start a new segment once the current one reaches this size
+SEGMENT_MAX_AGE = 3600                 # ... or once it has been open this many seconds
+FLUSH_INTERVAL = 1.0                   # Seconds between background flushes of buffered records
+FLUSH_MAX_RECORDS = 100                # Flush right away once this many records are buffered
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+LOCK_FILE = "writer.lock"  # Locked by the process writing to the store, for as long as it has the store open
+
+def _try_lock(file):
+    """
+    Take an exclusive lock on an open file without waiting.
+    The OS drops the lock when the process exits, so a crashed writer doesn't leave the store locked.
+    :return: False if another handle holds the lock.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+class TrafficStore:
+    """
+    Append-only log of traffic entries, stored as JSON lines in rotating segment files.
+    Appends are buffered and flushed periodically, so the cost per entry does not grow with the history,
+    and a crash can at most lose the buffered entries or leave a torn last line, which readers skip.
+    An in-memory index by traffic_id and timestamp points at each record's position in its segment. It is only
+    built by the first read() or traffic_ids(), so a store that only appends (car_det) opens instantly and
+    keeps nothing per record in memory.
+    Only one store writes to a directory at a time: the first segment it opens locks LOCK_FILE until close().
+    """
+
+    def __init__(self, directory=STORE_DIR, segment_max_bytes=SEGMENT_MAX_BYTES, segment_max_age=SEGMENT_MAX_AGE,
+                 flush_interval=FLUSH_INTERVAL, flush_max_records=FLUSH_MAX_RECORDS):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.flush_max_records = flush_max_records
+
+        self._lock = threading.RLock()
+        self._buffer = []
+        self._file = None
+        self._segment = None
+        self._segment_opened = 0
+        self._writer_lock = None
+        self._index = None  # traffic_id -> ([timestamps], [(segment, offset, length)]), built on first read
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+            self._flusher.start()
+
+    def segments(self):
+        """
+        List the segment file names, oldest first.
+        """
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    def _iter_segment(self, segment):
+        """
+        Yield (offset, length, record) for every complete record of a segment.
+        """
+        offset = 0
+        with open(self._segment_path(segment), "rb") as file:
+            for line in file:
+                length = len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None  # Torn write from a crash, skip it
+                if record is not None and line.endswith(b"\n"):
+                    yield offset, length, record
+                offset += length
+
+    def _add_to_index(self, record, segment, offset, length):
+        timestamps, locations = self._index.setdefault(record.get("traffic_id"), ([], []))
+        timestamp = record.get("timestamp", "")
+        # Records are appended in time order, so insort only moves entries for out-of-order clocks
+        position = bisect.bisect_right(timestamps, timestamp)
+        timestamps.insert(position, timestamp)
+        locations.insert(position, (segment, offset, length))
+
+    def _index_segment(self, segment):
+        for offset, length, record in self._iter_segment(segment):
+            self._add_to_index(record, segment, offset, length)
+
+    def _get_index(self):
+        # Called with the lock held, after a flush: scan the segments once, flush() keeps the index up to date
+        if self._index is None:
+            self._index = {}
+            for segment in self.segments():
+                self._index_segment(segment)
+        return self._index
+
+    def _acquire_writer_lock(self):
+        # True once this store holds the directory's writer lock
+        if self._writer_lock is None:
+            lock_file = open(os.path.join(self.directory, LOCK_FILE), "a+b")
+            if not _try_lock(lock_file):
+                lock_file.close()
+                return False
+            self._writer_lock = lock_file
+        return True
+
+    def _open_new_segment(self):
+        if not self._acquire_writer_lock():
+            raise RuntimeError(f"{self.directory} is being written by another process")
+        existing = self.segments()
+        number = int(existing[-1][len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 if existing else 1
+        self._segment = f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+        # Always start a fresh file, so a torn line left by a crash stays the last line of its segment
+        self._file = open(self._segment_path(self._segment), "ab")
+        self._segment_opened = time.time()
+
+    def _should_rotate(self):
+        return (
+            self._file.tell() >= self.segment_max_bytes
+            or time.time() - self._segment_opened >= self.segment_max_age
+        )
+
+    def append(self, record):
+        """
+        Buffer a record for writing. It is written at the next flush.
+        """
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.flush_max_records:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records to the current segment and sync it to disk.
+        """
+        with self._lock:
+            if not self._buffer:
+                return
+            if self._file is None or self._should_rotate():
+                if self._file is not None:
+                    self._file.close()
+                self._open_new_segment()
+
+            offset = self._file.tell()
+            for record in self._buffer:
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                self._file.write(line)
+                if self._index is not None:
+                    self._add_to_index(record, self._segment, offset, len(line))
+                offset += len(line)
+            self._buffer = []
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _flush_periodically(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing traffic store: {e}")
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._writer_lock is not None:
+                self._writer_lock.close()
+                self._writer_lock = None
+
+    def traffic_ids(self):
+        with self._lock:
+            self.flush()
+            return sorted(traffic_id for traffic_id in self._get_index() if traffic_id is not None)
+
+    def read(self, traffic_id, start=None, end=None):
+        """
+        Read the records of one traffic light, optionally limited to start <= timestamp <= end.
+        Timestamps use the '%Y-%m-%d %H:%M:%S' format of the records, which sorts like the times it encodes.
+        :return: List of records in timestamp order.
+        """
+        with self._lock:
+            self.flush()
+            timestamps, locations = self._get_index().get(traffic_id, ([], []))
+            low = 0 if start is None else bisect.bisect_left(timestamps, start)
+            high = len(timestamps) if end is None else bisect.bisect_right(timestamps, end)
+
+            records = []
+            handles = {}
+            try:
+                for segment, offset, length in locations[low:high]:
+                    if segment not in handles:
+                        handles[segment] = open(self._segment_path(segment), "rb")
+                    handle = handles[segment]
+                    handle.seek(offset)
+                    records.append(json.loads(handle.read(length)))
+            finally:
+                for handle in handles.values():
+                    handle.close()
+            return records
+
+    def iter_records(self):
+        """
+        Yield every stored record in append order.
+        """
+        with self._lock:
+            self.flush()
+            segments = self.segments()
+        for segment in segments:
+            for _, _, record in self._iter_segment(segment):
+                yield record
+
+    def export_json(self, file_path):
+        """
+        Write all records as one JSON array, in the same format save_message_to_file used to produce,
+        so calculate.load_traffic_data can read it. The file is replaced atomically.
+        """
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write("[")
+            separator = "\n"
+            for record in self.iter_records():
+                text = json.dumps(record, ensure_ascii=False, indent=4)
+                file.write(separator + "    " + text.replace("\n", "\n    "))
+                separator = ",\n"
+            file.write("\n]" if separator != "\n" else "]")
+        os.replace(temp_path, file_path)
+
+    def compact(self):
+        """
+        Merge all closed segments into a single segment, dropping torn lines left by crashes.
+        Only the store holding the writer lock can tell which segments are closed (all but the one it
+        writes to) and keep its index valid, so compacting a store another process writes to is refused.
+        :raises RuntimeError: If another process holds the directory's writer lock.
+        """
+        with self._lock:
+            if not self._acquire_writer_lock():
+                raise RuntimeError(f"{self.directory} is being written by another process, stop it before compacting")
+            self.flush()
+            closed = [segment for segment in self.segments() if segment != self._segment]
+            if len(closed) < 2:
+                return
+
+            # The merged segment reuses the name of the oldest one, so segment order is kept
+            target = closed[0]
+            temp_path = self._segment_path(target) + ".tmp"
+            with open(temp_path, "wb") as file:
+                for segment in closed:
+                    for _, _, record in self._iter_segment(segment):
+                        file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self._segment_path(target))
+            for segment in closed[1:]:
+                os.remove(self._segment_path(segment))
+
+            self._index = None  # Rebuilt by the next read
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the append-only traffic data store.")
+    parser.add_argument("command", choices=["export", "import", "compact"],
+                        help="export: write a JSON array file, import: append a JSON array file, "
+                             "compact: merge closed segments (refused while another process writes to the store)")
+    parser.add_argument("--store", default=STORE_DIR, help="Store directory")
+    parser.add_argument("--file", default="traffic_data.json", help="JSON array file written by export or read by import")
+    args = parser.parse_args()
+
+    store = TrafficStore(args.store, flush_interval=0)
+    if args.command == "export":
+        store.export_json(args.file)
+        print(f"Exported {args.store} to {args.file}")
+    elif args.command == "import":
+        with open(args.file, "r") as file:
+            for record in json.load(file):
+                store.append(record)
+        print(f"Imported {args.file} into {args.store}")
+    else:
+        try:
+            store.compact()
+        except RuntimeError as e:
+            store.close()
+            parser.exit(1, f"Not compacted: {e}\n")
+        print(f"Compacted {args.store}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,78 +2,93 @@ import cv2
 import numpy as np
 import base64
 import json
-
-# YOLO model setup (Assuming you have YOLOv4 model files)
-net = cv2.dnn.readNet('yolov4.weights', 'yolov4.cfg')
-layer_names = net.getLayerNames()
-output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
-
-# Load class labels
-with open("coco.names", "r") as f:
-    classes = [line.strip() for line in f.readlines()]
-
-# Constants for rows (Row boundaries as pixel heights)
-ROW_BOUNDARIES = [
-    (0, 200),   # Row 1 (top boundary, bottom boundary)
-    (200, 400), # Row 2
-    (400, 600), # Row 3
-    (600, 800)  # Row 4 (if applicable)
-]
-
-def detect_vehicles(image, traffic_id):
+import argparse
+from detector import VEHICLE_LABELS, postprocess, nms
+from models import get_model, get_classes, get_class_ids, get_input_size, add_model_arguments, configure_from_args
+from tracker import VehicleTracker
+from lanes import get_lane_map
+from annotation_writer import AnnotationWriter, OUTPUT_DIR, SCALE, JPEG_QUALITY, SEGMENT_SECONDS, KEEP_FILES
+
+# Tracking settings for video input
+DETECT_EVERY = 5   # Run YOLO on every N-th video frame, track in between
+STOP_LINE = 0.75   # Height of the stop line vehicles are counted at, as a fraction of the frame (top of row 4)
+
+def find_vehicles(image):
     """
-    Detect vehicles in an image and count them per row.
+    Run YOLO on an image and return the vehicles it finds.
+    :return: Tuple (boxes, labels) with boxes as an (N, 4) int array of [x, y, w, h].
     """
     height, width, _ = image.shape
 
-    # Pre-process the image for YOLO
-    blob = cv2.dnn.blobFromImage(image, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-    net.setInput(blob)
-    outs = net.forward(output_layers)
+    # Run YOLO (the backend pre-processes the image)
+    outs = get_model().infer([image], get_input_size())[0]
 
     # Analyze detections
-    class_ids, confidences, boxes = [], [], []
-    for out in outs:
-        for detection in out:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-            if confidence > 0.6 and classes[class_id] in ["car", "bus", "truck"]:
-                # Get bounding box coordinates
-                center_x = int(detection[0] * width)
-                center_y = int(detection[1] * height)
-                w = int(detection[2] * width)
-                h = int(detection[3] * height)
-                x = int(center_x - w / 2)
-                y = int(center_y - h / 2)
-
-                boxes.append([x, y, w, h, center_y])  # Include center_y for annotation
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
+    boxes, confidences, class_ids = postprocess(outs, width, height, 0.6, get_class_ids(VEHICLE_LABELS))
 
     # Apply Non-Maximum Suppression
-    indices = cv2.dnn.NMSBoxes([box[:4] for box in boxes], confidences, 0.6, 0.3)
-
-    row_counts = [{"row_id": i + 1, "cars": 0, "trucks": 0} for i in range(len(ROW_BOUNDARIES))]
-    annotated_boxes = []
+    indices = nms(boxes, confidences, 0.6, 0.3)
 
-    for i in indices.flatten():
-        x, y, w, h, center_y = boxes[i]
-        label = classes[class_ids[i]]
+    classes = get_classes()
+    return boxes[indices], [classes[class_id] for class_id in class_ids[indices]]
 
-        # Determine the row of the detection
-        for row_id, (top, bottom) in enumerate(ROW_BOUNDARIES):
-            if top <= y + h // 2 < bottom:  # Vehicle is in this row
-                if label == "car":
-                    row_counts[row_id]["cars"] += 1
-                elif label in ["bus", "truck"]:
-                    row_counts[row_id]["trucks"] += 1
+def count_rows(traffic_id, boxes, labels, width, height):
+    """
+    Count the vehicles per row (the camera's lanes, see lanes.py) and build the boxes to annotate.
+    :return: Tuple (row_counts, annotated_boxes).
+    """
+    lane_map = get_lane_map(traffic_id, width, height)
+    cars, trucks = lane_map.count(boxes, labels)
+    row_counts = [
+        {"row_id": row_id, "cars": int(row_cars), "trucks": int(row_trucks)}
+        for row_id, row_cars, row_trucks in zip(lane_map.row_ids, cars, trucks)
+    ]
 
-        # Store bounding box and center_y for visualization
-        annotated_boxes.append((x, y, w, h, label, center_y))
+    # Store bounding box and center_y for visualization
+    annotated_boxes = [(x, y, w, h, label, y + h // 2) for (x, y, w, h), label in zip(boxes.tolist(), labels)]
 
     return row_counts, annotated_boxes
 
+def detect_vehicles(image, traffic_id):
+    """
+    Detect vehicles in an image and count them per row.
+    """
+    height, width = image.shape[:2]
+    return count_rows(traffic_id, *find_vehicles(image), width, height)
+
+def track_video(source, traffic_id=1, detect_every=DETECT_EVERY, stop_line=STOP_LINE):
+    """
+    Count vehicles per row on a video file or stream, running YOLO only on every detect_every-th frame.
+    Counts come from the tracked vehicles, and each vehicle is counted once when it crosses the stop line.
+    :return: Generator of (frame, row_counts, annotated_boxes, crossings) per frame.
+    """
+    capture = cv2.VideoCapture(source)
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    tracker = VehicleTracker(int(stop_line * height))
+    frame_number = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+
+            if frame_number % detect_every == 0:
+                tracker.update(*find_vehicles(frame))
+            else:
+                tracker.predict()
+            frame_number += 1
+
+            row_counts, annotated_boxes = count_rows(traffic_id, *tracker.boxes(), width, height)
+            # Label each box with its track id so identities are visible on the frame
+            annotated_boxes = [
+                (x, y, w, h, f"{label} #{track.track_id}", center_y)
+                for (x, y, w, h, label, center_y), track in zip(annotated_boxes, tracker.tracks)
+            ]
+            yield frame, row_counts, annotated_boxes, tracker.crossings
+    finally:
+        capture.release()
+
 # Visualize detections on the image
 def visualize_detections(image, annotated_boxes):
     for x, y, w, h, label, center_y in annotated_boxes:
@@ -85,10 +100,67 @@ def visualize_detections(image, annotated_boxes):
         cv2.putText(image, text, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
     return image
 
-# Main logic to test without MQTT
-if __name__ == "__main__":
-    image_path = "images/image2.jpg"  # Replace with your image path
-    image = cv2.imread(image_path)
+def run_headless(args):
+    """
+    Detection without a display: annotated frames go to an AnnotationWriter, which draws and encodes
+    them on its own thread and drops frames rather than slowing down detection.
+    """
+    output_format = "jpeg" if args.image and not args.video else args.format
+    writer = AnnotationWriter(visualize_detections, args.output_dir, output_format, args.scale, args.quality,
+                              args.sample_every, args.fps, args.segment_seconds, args.keep)
+    try:
+        if args.video:
+            row_counts, crossings = [], 0
+            for frame, row_counts, annotated_boxes, crossings in track_video(args.video, detect_every=max(1, args.detect_every)):
+                writer.submit(frame, annotated_boxes)
+            print("Row Counts:", json.dumps(row_counts, indent=4))
+            print(f"Vehicles crossing the stop line: {crossings}")
+        else:
+            image = cv2.imread(args.image)
+            if image is None:
+                print("Error: Could not load image.")
+                return
+            row_counts, annotated_boxes = detect_vehicles(image, traffic_id=1)
+            writer.submit(image, annotated_boxes)
+            print("Row Counts:", json.dumps(row_counts, indent=4))
+    finally:
+        writer.close()
+        print(f"Annotation output in {args.output_dir}: {writer.stats()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect and count vehicles per row on an image or a video.")
+    parser.add_argument("--image", default="images/image2.jpg", help="Image to process")
+    parser.add_argument("--video", help="Video file or stream URL to track vehicles on instead of a single image")
+    parser.add_argument("--detect-every", type=int, default=DETECT_EVERY, help="Run YOLO on every N-th video frame")
+    parser.add_argument("--headless", action="store_true", help="Write annotated frames to files instead of showing them")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory for the annotated output (headless)")
+    parser.add_argument("--format", choices=("mjpeg", "mp4", "jpeg"), default="mjpeg", help="Rolling video files or JPEG snapshots (headless)")
+    parser.add_argument("--scale", type=float, default=SCALE, help="Downscale factor of the annotated output (headless)")
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY, help="JPEG quality of the annotated output (headless)")
+    parser.add_argument("--sample-every", type=int, default=1, help="Annotate every N-th frame (headless)")
+    parser.add_argument("--fps", type=float, default=10.0, help="Frame rate of the written video files (headless)")
+    parser.add_argument("--segment-seconds", type=float, default=SEGMENT_SECONDS, help="Length of each video file (headless)")
+    parser.add_argument("--keep", type=int, default=KEEP_FILES, help="Files kept on disk, 0 keeps all (headless)")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    if args.headless:
+        run_headless(args)
+        return
+
+    if args.video:
+        row_counts, crossings = [], 0
+        for frame, row_counts, annotated_boxes, crossings in track_video(args.video, detect_every=max(1, args.detect_every)):
+            cv2.imshow("Vehicle Detections", visualize_detections(frame, annotated_boxes))
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+        print("Row Counts:", json.dumps(row_counts, indent=4))
+        print(f"Vehicles crossing the stop line: {crossings}")
+        cv2.destroyAllWindows()
+        return
+
+    image = cv2.imread(args.image)
 
     if image is None:
         print("Error: Could not load image.")
@@ -104,3 +176,7 @@ if __name__ == "__main__":
         cv2.imshow("Vehicle Detections", result_image)
         cv2.waitKey(0)
         cv2.destroyAllWindows()
+
+# Main logic to test without MQTT
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import argparse
+import threading
+import numpy as np
+from datetime import datetime
+from calculate import STOP_LINE_DISTANCE
+from tracker import VehicleTracker
+
+# Optional per-camera stop lines: {"<traffic_id>": [[x0, y0], [x1, y1]]} in normalized coordinates (0-1).
+# Points are listed so that, walking from the first to the second, the far side of the line
+# (the intersection) is on the right; cameras not listed use DEFAULT_STOP_LINE.
+STOP_LINES_FILE = "stop_lines.json"
+DEFAULT_STOP_LINE = [[0.0, 0.75], [1.0, 0.75]]  # Horizontal at the top of row 4, traffic moving down the frame
+
+# Light colors arrive as {"traffic_id", "color"} on LIGHT_COLOR_TOPIC, color being one of LIGHT_COLORS
+LIGHT_COLOR_TOPIC = "traffic/light/color"
+LIGHT_COLORS = ("red", "yellow", "green")
+PHASE_MAX_AGE = 120  # Seconds after which a light's last color is no longer trusted
+
+VIOLATION_TOPIC = "traffic/violation{traffic_id}"
+
+def load_stop_lines(path=STOP_LINES_FILE):
+    """
+    Load the per-camera stop lines.
+    :return: Dict {traffic_id: [[x0, y0], [x1, y1]]}, empty if the file doesn't exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return {int(traffic_id): line for traffic_id, line in json.load(file).items()}
+
+class LightPhases:
+    """
+    Current color of every traffic light, from the {"traffic_id", "color"} messages on LIGHT_COLOR_TOPIC
+    (the ones the dashboard shows). A light is only red while its last message says so and is at most
+    max_age seconds old; lights without fresh color information are unknown and never checked.
+    """
+
+    def __init__(self, max_age=PHASE_MAX_AGE):
+        """
+        :param max_age: Seconds a color stays valid, publishers sending only changes must repeat it within this.
+        """
+        self.max_age = max_age
+        self._colors = {}  # traffic_id -> [color, time it started, time it was last confirmed]
+        self._lock = threading.Lock()
+
+    def on_color(self, message, now=None):
+        """
+        Record a color message, a {"traffic_id", "color"} dict or a list of them
+        ("phase" is accepted for "color"). Entries with an unknown color make the light unknown.
+        """
+        now = time.time() if now is None else now
+        messages = message if isinstance(message, list) else [message]
+        with self._lock:
+            for entry in messages:
+                traffic_id = int(entry["traffic_id"])
+                color = str(entry.get("color", entry.get("phase", ""))).lower()
+                if color not in LIGHT_COLORS:
+                    self._colors.pop(traffic_id, None)
+                    continue
+                current = self._colors.get(traffic_id)
+                if current is not None and current[0] == color and now - current[2] <= self.max_age:
+                    current[2] = now
+                else:
+                    self._colors[traffic_id] = [color, now, now]
+
+    def red_since(self, traffic_id, now=None):
+        """
+        Start of the current red phase of a light, or None while it isn't red or its color is unknown.
+        """
+        now = time.time() if now is None else now
+        current = self._colors.get(traffic_id)
+        if current is None or current[0] != "red" or now - current[2] > self.max_age:
+            return None
+        return current[1]
+
+class _RedWindow:
+    # Per-camera state of the current red phase
+    __slots__ = ("red_since", "approaching", "reported")
+
+    def __init__(self, red_since):
+        self.red_since = red_since
+        self.approaching = set()  # Tracks seen before the line during this red phase
+        self.reported = set()     # Tracks already reported
+
+class ViolationEngine:
+    """
+    Red-light violations from the tracked boxes of each camera frame.
+    While a light is red, the signed distance of every box centre to the camera's stop line is computed
+    in one pass; a vehicle violates when it is seen more than `margin` pixels before the line and later
+    more than `margin` pixels past it within the same red phase. Vehicles already past the line when the
+    light turned red are not reported, and each vehicle is reported once per red phase.
+    Only observed positions count: check_tracks() leaves out the tracks the tracker only predicted.
+    During green, check() returns right after the phase lookup.
+    """
+
+    def __init__(self, phases=None, margin=STOP_LINE_DISTANCE, stop_lines=None):
+        """
+        :param phases: LightPhases fed with the color messages.
+        :param margin: Distance in pixels a centre must be from the line to count as before or past it.
+        :param stop_lines: Dict {traffic_id: line}, defaults to the lines of STOP_LINES_FILE.
+        """
+        self.phases = phases or LightPhases()
+        self.margin = margin
+        self.stop_lines = load_stop_lines() if stop_lines is None else stop_lines
+        self._windows = {}  # traffic_id -> _RedWindow
+
+    def _line(self, traffic_id, width, height):
+        # Stop line in pixels: a point on it and the unit normal pointing past it
+        (x0, y0), (x1, y1) = self.stop_lines.get(traffic_id, DEFAULT_STOP_LINE)
+        start = np.array([x0 * width, y0 * height])
+        direction = np.array([(x1 - x0) * width, (y1 - y0) * height])
+        normal = np.array([-direction[1], direction[0]]) / max(np.linalg.norm(direction), 1e-6)
+        return start, normal
+
+    def check(self, traffic_id, boxes, labels, track_ids, width, height, now=None):
+        """
+        Check the boxes of one frame.
+        :param boxes: (N, 4) array of [x, y, w, h] boxes in frame pixels.
+        :param labels: N class labels.
+        :param track_ids: N tracker ids identifying the vehicles across frames.
+        :return: List of violation events (dicts), empty during green.
+        """
+        now = time.time() if now is None else now
+        red_since = self.phases.red_since(traffic_id, now)
+        if red_since is None:
+            self._windows.pop(traffic_id, None)
+            return []
+
+        window = self._windows.get(traffic_id)
+        if window is None or window.red_since != red_since:
+            window = self._windows[traffic_id] = _RedWindow(red_since)
+        if len(boxes) == 0:
+            return []
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        start, normal = self._line(traffic_id, width, height)
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        distances = (centers - start) @ normal
+
+        track_ids = np.asarray(track_ids)
+        window.approaching.update(track_ids[distances < -self.margin].tolist())
+
+        events = []
+        for index in np.flatnonzero(distances > self.margin).tolist():
+            track_id = int(track_ids[index])
+            if track_id not in window.approaching or track_id in window.reported:
+                continue
+            window.reported.add(track_id)
+            events.append({
+                "traffic_id": traffic_id,
+                "track_id": track_id,
+                "label": labels[index],
+                "box": [int(value) for value in boxes[index]],
+                "distance": round(float(distances[index]), 1),
+                "red_for": round(now - red_since, 2),
+                "timestamp": datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+            })
+        return events
+
+    def check_tracks(self, traffic_id, tracks, width, height, now=None):
+        """
+        Check the tracker.Track objects matched to a detection on this frame.
+        Tracks moved by prediction only are extrapolations and would report vehicles that stopped short of the line.
+        """
+        observed = [track for track in tracks if track.frames_since_update == 0]
+        boxes = np.array([track.box for track in observed], dtype=np.float64).reshape(-1, 4)
+        return self.check(traffic_id, boxes, [track.label for track in observed],
+                          [track.track_id for track in observed], width, height, now)
+
+def publish_violations(client, events):
+    """
+    Publish violation events on their camera's violation topic.
+    """
+    for event in events:
+        client.publish(VIOLATION_TOPIC.format(traffic_id=event["traffic_id"]), json.dumps(event))
+
+def simulate(positions, detect_every=3, frame_size=(1280, 720), red=True):
+    """
+    Run a vehicle through the tracker and the engine, a frame every 0.1 s on a red (or green) light.
+    :param positions: Centre height of the vehicle on every frame, YOLO seeing it every detect_every-th frame.
+    :return: Tuple (violation events, tracker crossings).
+    """
+    width, height = frame_size
+    phases = LightPhases()
+    phases.on_color({"traffic_id": 1, "color": "red" if red else "green"}, now=0)
+    engine = ViolationEngine(phases, stop_lines={})
+    tracker = VehicleTracker(int(DEFAULT_STOP_LINE[0][1] * height))
+    events = []
+    for frame, y in enumerate(positions):
+        if frame % detect_every == 0:
+            tracker.update(np.array([[600, y - 30, 80, 60]]), ["car"])
+        else:
+            tracker.predict()
+        events += engine.check_tracks(1, tracker.tracks, width, height, now=frame * 0.1)
+    return events, tracker.crossings
+
+def approach(stop_y, speed=12.0, frames=40, start=300.0):
+    """
+    Centre heights of a vehicle driving at `speed` pixels per frame, braking hard over the last 30 px to stop at stop_y.
+    """
+    positions, y = [], start
+    for _ in range(frames):
+        positions.append(y)
+        y = min(stop_y, y + (speed if y < stop_y - 30 else max(1.0, (stop_y - y) / 2)))
+    return positions
+
+def main():
+    parser = argparse.ArgumentParser(description="Red-light violation engine.")
+    parser.add_argument("--check", action="store_true", help="Check the engine on simulated vehicles")
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        return
+
+    stop_line = DEFAULT_STOP_LINE[0][1] * 720
+    cases = [
+        # (name, positions, light is red, expected violations, expected crossings)
+        ("car stopping 6 px before the line", approach(stop_line - 6), True, 0, 0),
+        ("car driving through on red", [300.0 + 10 * frame for frame in range(50)], True, 1, 1),
+        ("car driving through on green", [300.0 + 10 * frame for frame in range(50)], False, 0, 1),
+        ("car already past the line", [stop_line + 20 + 5 * frame for frame in range(20)], True, 0, 0)
+    ]
+    failed = False
+    for name, positions, red, expected_events, expected_crossings in cases:
+        events, crossings = simulate(positions, red=red)
+        ok = len(events) == expected_events and crossings == expected_crossings
+        failed |= not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name} ({len(events)} violations, {crossings} crossings)")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()